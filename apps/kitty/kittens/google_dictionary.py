@@ -1,18 +1,205 @@
+import functools
+import itertools
+import os
 import re
 
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Options come as `key=value` words after the kitten path, e.g.
+#   kitten hints --customize-processing ./kittens/google_dictionary.py unique
+# (hints rejects unknown --flags, so they can't look like its own options).
+DEFAULT_OPTIONS = {
+    # Comma-separated token classes to mark, see TOKEN_CLASSES
+    "classes": "word",
+    # Mark each token once (words case-insensitively) instead of every
+    # occurrence
+    "unique": False,
+    # Skip words shorter than this
+    "min_length": 1,
+    # "builtin" for a small English list, or a file with one word per line
+    "stop_words": "",
+    # Never more marks than this (0: no limit)
+    "max_marks": 0,
+    # The last N lines are the screen: they're marked first and the rest of
+    # the text only fills up what's left of max_marks (0: all text is screen)
+    "screen_lines": 0,
+}
+
+# One named group per token class. When several are wanted they're joined
+# into one alternation in this order, so the more specific classes win where
+# they overlap (a URL is not a path, a SHA is not a word, ...).
+TOKEN_CLASSES = {
+    "url": r"""(?P<url>(?:https?|ftp|file)://[^\s\0<>"'`]*[^\s\0<>"'`.,;:!?)\]}])""",
+    # Paths only start where a run of path characters starts, or a long run
+    # would be rescanned from each of its characters
+    "path": r"""(?P<path>(?<![\w.~/+-])
+        (?:(?:~|\.\.?)?(?:/[\w.~+-]*[\w~+-])+/? # /abs, ~/home, ./rel, ../rel
+          | [\w.+-]+(?:/[\w.~+-]*[\w~+-])+      # dir/file, no trailing dot
+          | [\w+-][\w.+-]*\.[A-Za-z]\w*(?=:\d) # file.ext, only with a :line
+        )(?::\d+)?)""",
+    "ip": r"(?P<ip>\b(?:\d{1,3}\.){3}\d{1,3}\b)",
+    # Hex with at least one letter and one digit, so neither plain numbers
+    # nor words like "decade" count
+    "hash": r"(?P<hash>\b(?=[0-9a-f]*[a-f])(?=[0-9a-f]*\d)[0-9a-f]{7,40}\b)",
+    "number": r"(?P<number>\b\d+(?:\.\d+)?\b)",
+    "word": r"(?P<word>\w{%d,})",
+}
+
+# Characters of scrollback read at a time, see scrollback_words()
+SCROLLBACK_BLOCK = 64 * 1024
+
+BUILTIN_STOP_WORDS = frozenset(
+    """a an and are as at be but by for from had has have he her his i if in
+    into is it its me my no not of on or our she so than that the their them
+    then there these they this to was we were what when which who will with
+    you your""".split()
+)
+
+
+def parse_options(extra_cli_args):
+    options = dict(DEFAULT_OPTIONS)
+    for arg in extra_cli_args:
+        key, sep, value = arg.partition("=")
+        key = key.replace("-", "_")
+        if key not in options:
+            continue
+        if isinstance(options[key], bool):
+            options[key] = not sep or value.lower() in ("1", "yes", "true", "on")
+        elif isinstance(options[key], int):
+            options[key] = int(value)
+        else:
+            options[key] = value
+    return options
+
+
+@functools.lru_cache(maxsize=None)
+def token_pattern(classes, min_length):
+    """One regex for all the `classes` (a comma-separated string)"""
+    wanted = [name.strip() for name in classes.split(",")]
+    unknown = set(wanted) - set(TOKEN_CLASSES)
+    if unknown:
+        raise ValueError(f"unknown token classes: {', '.join(sorted(unknown))}")
+    parts = [TOKEN_CLASSES[name] for name in TOKEN_CLASSES if name in wanted]
+    if "word" in wanted:
+        parts[-1] %= max(min_length, 1)
+    return re.compile("|".join(parts), re.VERBOSE)
+
+
+def load_stop_words(source):
+    if not source:
+        return frozenset()
+    if source == "builtin":
+        return BUILTIN_STOP_WORDS
+    with open(source, encoding="utf-8") as f:
+        return frozenset(line.strip().lower() for line in f if line.strip())
+
+
+def screen_start(text, screen_lines):
+    """Offset of the first of the last `screen_lines` lines of `text`"""
+    if screen_lines <= 0:
+        return 0
+    end = len(text.rstrip("\n"))
+    for _ in range(screen_lines):
+        end = text.rfind("\n", 0, end)
+        if end < 0:
+            return 0
+    return end + 1
+
+
+def tokens_in(pattern, text, start, end, stop_words, seen):
+    """(start, end, text, class) of the wanted tokens in text[start:end]
+
+    `seen` is the set of tokens marked so far when marking unique ones, or
+    None to mark every occurrence. Stop words only apply to words.
+    """
+    for m in pattern.finditer(text, start, end):
+        kind = m.lastgroup
+        token = m.group()
+        if kind == "word":
+            key = token.lower()
+            if key in stop_words:
+                continue
+        else:
+            key = token
+        if seen is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        yield m.start(), m.end(), token, kind
+
 
 def mark(text, args, Mark, extra_cli_args, *a):
     # This function is responsible for finding all
     # matching text. extra_cli_args are any extra arguments
     # passed on the command line when invoking the kitten.
-    # We mark all individual word for potential selection
-    for idx, m in enumerate(re.finditer(r"\w+", text)):
-        start, end = m.span()
-        mark_text = text[start:end].replace("\n", "").replace("\0", "")
-        # The empty dictionary below will be available as groupdicts
-        # in handle_result() and can contain string keys and arbitrary JSON
-        # serializable values.
-        yield Mark(idx, start, end, mark_text, {})
+    # We mark the individual words (and URLs, paths, ... with `classes`), see
+    # DEFAULT_OPTIONS for how to narrow them down on a large scrollback
+    options = parse_options(extra_cli_args)
+    # All classes are found in one regex pass, the word length filter
+    # included. Screen lines are split by "\n" and padded with "\0", and
+    # no class matches either: URLs exclude "\0" along with whitespace, and
+    # the rest are built from \w, digits and path punctuation. So no token
+    # runs across two lines and the text needs no cleaning up
+    pattern = token_pattern(options["classes"], options["min_length"])
+    stop_words = load_stop_words(options["stop_words"])
+    seen = set() if options["unique"] else None
+    limit = options["max_marks"] or len(text)
+    screen = screen_start(text, options["screen_lines"])
+
+    # The screen is marked front to back and streamed, stopping at the limit
+    marks = itertools.islice(
+        tokens_in(pattern, text, screen, len(text), stop_words, seen), limit
+    )
+    if screen:
+        marks = list(marks)
+        # What's left goes to the scrollback words closest to the screen;
+        # these are scanned before the screen, so they go first
+        left = limit - len(marks)
+        if left > 0:
+            scrollback = scrollback_words(
+                pattern, text, screen, stop_words, seen, left
+            )
+            marks = itertools.chain(scrollback, marks)
+        else:
+            marks = iter(marks)
+
+    for idx, (start, end, mark_text, kind) in enumerate(marks):
+        # The dictionary below will be available as groupdicts in
+        # handle_result() and can contain string keys and arbitrary JSON
+        # serializable values. It holds the token class under "type", plus
+        # "path" and "line" for paths with a line number
+        data = {"type": kind}
+        if kind == "path":
+            path, sep, line = mark_text.rpartition(":")
+            if sep and line.isdigit():
+                data["path"], data["line"] = path, int(line)
+        yield Mark(idx, start, end, mark_text, data)
+
+
+def scrollback_words(pattern, text, screen, stop_words, seen, limit):
+    """The last `limit` wanted tokens before the screen, in text order
+
+    The scrollback is read backwards from the screen a block of lines at a
+    time, so it's only scanned as far as it takes to fill up the limit.
+    """
+    found = []
+    end = screen
+    while end > 0 and len(found) < limit:
+        start = text.rfind("\n", 0, max(end - SCROLLBACK_BLOCK, 0)) + 1
+        block = list(tokens_in(pattern, text, start, end, stop_words, None))
+        # Closest to the screen first, so unique words keep that occurrence
+        for word in reversed(block):
+            if seen is not None:
+                key = word[2].lower() if word[3] == "word" else word[2]
+                if key in seen:
+                    continue
+                seen.add(key)
+            found.append(word)
+            if len(found) == limit:
+                break
+        end = start
+    found.reverse()
+    return found
 
 
 def handle_result(args, data, target_window_id, boss, extra_cli_args, *a):
@@ -24,7 +211,56 @@ def handle_result(args, data, target_window_id, boss, extra_cli_args, *a):
     for m, g in zip(data["match"], data["groupdicts"]):
         if m:
             matches.append(m), groupdicts.append(g)
-    for word, match_data in zip(matches, groupdicts):
+    # Each class gets its own action, words are looked up together
+    words = []
+    for text, match_data in zip(matches, groupdicts):
+        kind = match_data.get("type", "word")
+        if kind == "url":
+            boss.open_url(text)
+        elif kind == "path":
+            path, line = match_data.get("path", text), match_data.get("line")
+            editor = os.environ.get("EDITOR") or "nvim"
+            command = [editor, f"+{line}", path] if line else [editor, path]
+            launch_overlay(boss, target_window_id, "--cwd=current", *command)
+        elif kind == "hash":
+            launch_overlay(boss, target_window_id, "--cwd=current", "git", "show", text)
+        elif kind in ("ip", "number"):
+            copy_to_clipboard(text)
+        else:
+            words.append(text)
+    if words:
+        look_up(boss, target_window_id, words)
+
+
+def look_up(boss, target_window_id, words):
+    # With an offline index (see offline_dictionary.py) the definitions of all
+    # the words show up in one overlay, which also lists several words at once
+    # instead of opening a browser tab for each
+    if len(words) > 1 or os.path.exists(offline_index()):
+        script = os.path.join(HERE, "offline_dictionary.py")
+        launch_overlay(boss, target_window_id, "python3", script, "define", *words)
+        return
+    for word in words:
         # Lookup the word in a dictionary, the open_url function
         # will open the provided url in the system browser
         boss.open_url(f"https://www.google.com/search?q=define:{word}")
+
+
+def launch_overlay(boss, target_window_id, *args):
+    window = boss.window_id_map.get(target_window_id)
+    boss.call_remote_control(window, ("launch", "--type=overlay", *args))
+
+
+def copy_to_clipboard(text):
+    try:
+        from kitty.clipboard import set_clipboard_string
+    except ImportError:  # kitty < 0.28
+        from kitty.fast_data_types import set_clipboard_string
+    set_clipboard_string(text)
+
+
+def offline_index():
+    # Same default as offline_dictionary.DEFAULT_INDEX, without importing it
+    # into kitty itself
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache, "kitty-dictionary", "dictionary.idx")
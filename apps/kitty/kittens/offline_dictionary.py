@@ -0,0 +1,556 @@
+"""Offline dictionary for the google_dictionary kitten.
+
+Build an index once from a dictionary source, then look words up with a
+binary search over the memory-mapped index, without reading it all in:
+
+    python3 offline_dictionary.py build /usr/share/wordnet  # WordNet dict dir
+    python3 offline_dictionary.py build gcide.index         # dictd .index/.dict(.dz)
+    python3 offline_dictionary.py build words.tsv           # word<TAB>definition
+    python3 offline_dictionary.py build-spelling [words.txt]  # `word [count]` lines
+    python3 offline_dictionary.py define serendipity ephemeral
+    python3 offline_dictionary.py stats                     # lookup cache counters
+
+The index goes to ~/.cache/kitty-dictionary/ unless --index says otherwise.
+Its layout (all integers little-endian):
+
+    b"MCRADIC1"  u32 count  u32 reserved
+    u64 offsets[count + 1]          # record i is data[offsets[i]:offsets[i + 1]]
+    records sorted by key           # key b"\\0" definition, UTF-8, key lowercased
+
+The kitten runs `define` in a kitty overlay with all the selected words at
+once; words that aren't in the index get a Google link instead, plus the
+closest known words when a spelling index (see build_spelling()) exists.
+Lookups go through an LRU cache kept in lookups.json next to the index.
+"""
+
+import argparse
+import array
+import bisect
+import collections
+import gzip
+import json
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import zlib
+
+MAGIC = b"MCRADIC1"
+HEADER = struct.Struct("<8sII")
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "kitty-dictionary",
+)
+DEFAULT_INDEX = os.path.join(CACHE_DIR, "dictionary.idx")
+DEFAULT_SPELLING = os.path.join(CACHE_DIR, "spelling.idx")
+CACHE_SIZE = 4096
+
+GOOGLE_DEFINE = "https://www.google.com/search?q=define:{}"
+
+DICTD_DIGITS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+SPELLING_MAGIC = b"MCRASPL1"
+SPELLING_HEADER = struct.Struct("<8sIIBB6x")
+
+WORDNET_POS = {"noun": "n.", "verb": "v.", "adj": "adj.", "adv": "adv."}
+
+
+def fold(word):
+    """The key a word is stored and looked up under"""
+    return word.strip().lower().encode("utf-8")
+
+
+# Sources ---------------------------------------------------------------------
+
+
+def read_tsv(path):
+    """(word, definition) from `word<TAB>definition` lines"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            word, sep, definition = line.rstrip("\n").partition("\t")
+            if sep and word:
+                yield word, definition.replace("\\n", "\n")
+
+
+def dictd_number(text):
+    """Decode a dictd base64 offset/length (a plain base-64 number)"""
+    value = 0
+    for char in text:
+        value = value * 64 + DICTD_DIGITS.index(char)
+    return value
+
+
+def read_dictd(index_path):
+    """(word, definition) from a dictd `.index` and its `.dict` or `.dict.dz`"""
+    base = index_path[: -len(".index")]
+    if os.path.exists(base + ".dict"):
+        data_file = open(base + ".dict", "rb")
+    else:
+        # dictzip files are plain gzip files to everything but dictd
+        data_file = gzip.open(base + ".dict.dz", "rb")
+    with data_file, open(index_path, encoding="utf-8", errors="replace") as index:
+        for line in index:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 3 or fields[0].startswith("00-database"):
+                continue
+            data_file.seek(dictd_number(fields[1]))
+            definition = data_file.read(dictd_number(fields[2]))
+            yield fields[0], definition.decode("utf-8", "replace").strip()
+
+
+def read_wordnet(folder):
+    """(word, definition) from the data.noun/verb/adj/adv files of WordNet"""
+    for pos, label in WORDNET_POS.items():
+        path = os.path.join(folder, f"data.{pos}")
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                # The license header lines start with spaces
+                if line.startswith(" "):
+                    continue
+                head, _, gloss = line.partition(" | ")
+                fields = head.split()
+                count = int(fields[3], 16)
+                for word in fields[4 : 4 + 2 * count : 2]:
+                    # Adjectives may carry a marker like "(a)"
+                    word = word.split("(")[0].replace("_", " ")
+                    yield word, f"{label} {gloss.strip()}"
+
+
+def read_source(path):
+    if os.path.isdir(path):
+        return read_wordnet(path)
+    if path.endswith(".index"):
+        return read_dictd(path)
+    return read_tsv(path)
+
+
+# Index -----------------------------------------------------------------------
+
+
+def build_index(entries, index_path):
+    """Write the sorted index of (word, definition) pairs; returns the count
+
+    Definitions of the same word are joined, one per line, in source order.
+    """
+    merged = {}
+    for word, definition in entries:
+        key = fold(word)
+        if key:
+            merged.setdefault(key, []).append(definition)
+
+    keys = sorted(merged)
+    records = [key + b"\0" + "\n".join(merged[key]).encode("utf-8") for key in keys]
+    offsets = [HEADER.size + 8 * (len(records) + 1)]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    temp = f"{index_path}.tmp"
+    with open(temp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records), 0))
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        f.writelines(records)
+    os.replace(temp, index_path)
+    return len(records)
+
+
+class Dictionary:
+    """A memory-mapped index; only the pages a lookup touches are read"""
+
+    def __init__(self, index_path=DEFAULT_INDEX):
+        with open(index_path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, _ = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f"{index_path} is not a dictionary index")
+
+    def offset(self, i):
+        return struct.unpack_from("<Q", self.data, HEADER.size + 8 * i)[0]
+
+    def key(self, i):
+        start = self.offset(i)
+        return self.data[start : self.data.find(b"\0", start)]
+
+    def find(self, key):
+        """Position of the first record whose key is >= `key`"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, word):
+        """The definition of `word`, or None"""
+        key = fold(word)
+        i = self.find(key)
+        if i == self.count:
+            return None
+        start, end = self.offset(i), self.offset(i + 1)
+        split = self.data.find(b"\0", start, end)
+        if self.data[start:split] != key:
+            return None
+        return self.data[split + 1 : end].decode("utf-8", "replace")
+
+    def close(self):
+        self.data.close()
+
+
+# Lookup cache ----------------------------------------------------------------
+
+
+class LookupCache:
+    """LRU cache of definitions (None for misses), persisted between runs
+
+    The file is only read on the first `get` and written back by `save`, so
+    a kitten run that never looks anything up doesn't pay for it. Entries
+    are dropped when the index they came from is rebuilt.
+    """
+
+    def __init__(self, path, index_path, capacity=CACHE_SIZE):
+        self.path = path
+        self.capacity = capacity
+        self.index_path = index_path
+        self.entries = None  # word -> definition, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+
+    def index_stamp(self):
+        try:
+            stat = os.stat(self.index_path)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def load(self):
+        self.entries = collections.OrderedDict()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.hits += saved.get("hits", 0)
+        self.misses += saved.get("misses", 0)
+        if saved.get("index") == self.index_stamp():
+            self.entries.update(saved.get("entries", []))
+
+    def get(self, word):
+        """(found, definition) for `word`, counting the hit or miss"""
+        if self.entries is None:
+            self.load()
+        self.dirty = True
+        if word in self.entries:
+            self.entries.move_to_end(word)
+            self.hits += 1
+            return True, self.entries[word]
+        self.misses += 1
+        return False, None
+
+    def put(self, word, definition):
+        if self.entries is None:
+            self.load()
+        self.entries[word] = definition
+        self.entries.move_to_end(word)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        saved = {
+            "index": self.index_stamp(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": list(self.entries.items()),
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(saved, f)
+        os.replace(temp, self.path)
+        self.dirty = False
+
+    def stats(self):
+        if self.entries is None:
+            self.load()
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def lookup_many(words, cache, index_path):
+    """{word: definition or None} for all `words` in one batch
+
+    Cached words never touch the index; the rest are looked up in sorted
+    order, so neighbouring searches share the pages they read. Without an
+    index every word is a miss.
+    """
+    found = {}
+    missing = []
+    for word in dict.fromkeys(words):
+        hit, definition = cache.get(word.lower())
+        if hit:
+            found[word] = definition
+        else:
+            missing.append(word)
+
+    if missing:
+        dictionary = Dictionary(index_path) if os.path.exists(index_path) else None
+        for word in sorted(missing, key=fold):
+            definition = dictionary.lookup(word) if dictionary else None
+            found[word] = definition
+            if dictionary:
+                cache.put(word.lower(), definition)
+        if dictionary:
+            dictionary.close()
+    cache.save()
+    return found
+
+
+# Spelling --------------------------------------------------------------------
+
+
+def read_word_list(path):
+    """(word, count) from `word [count]` lines; a missing count is 1"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            fields = line.split()
+            if fields:
+                count = int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else 1
+                yield fields[0], count
+
+
+def deletes(word, max_distance):
+    """`word` and every string made by deleting up to `max_distance` characters"""
+    found = {word}
+    edge = [word]
+    for _ in range(max_distance):
+        edge = [w[:i] + w[i + 1 :] for w in edge if len(w) > 1 for i in range(len(w))]
+        edge = [w for w in edge if w not in found]
+        found.update(edge)
+    return found
+
+
+def edit_distance(a, b, limit):
+    """Damerau-Levenshtein (optimal string alignment) distance, or limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def build_spelling(entries, path, max_distance=2, prefix_length=7):
+    """Write the deletion index of (word, count) pairs; returns the word count
+
+    SymSpell style: every string within `max_distance` deletions of a word's
+    first `prefix_length` characters points back at the word, so a query
+    only has to look up its own deletions. Keys are CRC32s of the deletions,
+    stored as sorted u64 (crc << 32 | word id); collisions just add
+    candidates that the distance check drops. Layout, native byte order:
+
+        b"MCRASPL1"  u32 words  u32 keys  u8 max_distance  u8 prefix_length
+        u64 keys[keys]  u32 offsets[words + 1]  u32 counts[words]  words
+    """
+    counts = collections.Counter()
+    for word, count in entries:
+        counts[word.lower()] += count
+    words = sorted(counts)
+
+    # Bucketed by the top byte of the CRC, so each bucket sorts on its own
+    # instead of one list of every key
+    buckets = [array.array("Q") for _ in range(256)]
+    for word_id, word in enumerate(words):
+        for delete in deletes(word[:prefix_length], max_distance):
+            crc = zlib.crc32(delete.encode("utf-8"))
+            buckets[crc >> 24].append(crc << 32 | word_id)
+
+    blob = [word.encode("utf-8") for word in words]
+    offsets = array.array("I", [0])
+    for word in blob:
+        offsets.append(offsets[-1] + len(word))
+    keys = sum(len(bucket) for bucket in buckets)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp = f"{path}.tmp"
+    with open(temp, "wb") as f:
+        header = (SPELLING_MAGIC, len(words), keys, max_distance, prefix_length)
+        f.write(SPELLING_HEADER.pack(*header))
+        for bucket in buckets:
+            array.array("Q", sorted(bucket)).tofile(f)
+        offsets.tofile(f)
+        array.array("I", (counts[word] for word in words)).tofile(f)
+        f.writelines(blob)
+    os.replace(temp, path)
+    return len(words)
+
+
+class Speller:
+    """Suggestions from a memory-mapped deletion index, see build_spelling()"""
+
+    def __init__(self, path=DEFAULT_SPELLING):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, keys, self.max_distance, self.prefix_length = (
+            SPELLING_HEADER.unpack_from(self.data)
+        )
+        if magic != SPELLING_MAGIC:
+            raise ValueError(f"{path} is not a spelling index")
+        view = memoryview(self.data)
+        start = SPELLING_HEADER.size
+        self.keys = view[start : start + 8 * keys].cast("Q")
+        start += 8 * keys
+        self.offsets = view[start : start + 4 * (self.count + 1)].cast("I")
+        start += 4 * (self.count + 1)
+        self.counts = view[start : start + 4 * self.count].cast("I")
+        self.words_start = start + 4 * self.count
+        view.release()
+
+    def word(self, word_id):
+        start = self.words_start + self.offsets[word_id]
+        end = self.words_start + self.offsets[word_id + 1]
+        return self.data[start:end].decode("utf-8")
+
+    def suggest(self, word, limit=5):
+        """Up to `limit` known words closest to `word`, most common first on ties"""
+        word = word.lower()
+        candidates = set()
+        for delete in deletes(word[: self.prefix_length], self.max_distance):
+            crc = zlib.crc32(delete.encode("utf-8"))
+            lo = bisect.bisect_left(self.keys, crc << 32)
+            hi = bisect.bisect_left(self.keys, (crc + 1) << 32, lo)
+            candidates.update(key & 0xFFFFFFFF for key in self.keys[lo:hi])
+
+        ranked = []
+        for word_id in candidates:
+            candidate = self.word(word_id)
+            distance = edit_distance(word, candidate, self.max_distance)
+            if 0 < distance <= self.max_distance:
+                ranked.append((distance, -self.counts[word_id], candidate))
+        ranked.sort()
+        return [candidate for _, _, candidate in ranked[:limit]]
+
+    def close(self):
+        for view in (self.keys, self.offsets, self.counts):
+            view.release()
+        self.data.close()
+
+
+# Overlay ---------------------------------------------------------------------
+
+
+def render(word, definition, suggestions=()):
+    """One word's section of the overlay text"""
+    if definition is None:
+        link = GOOGLE_DEFINE.format(word)
+        text = f"\x1b[1m{word}\x1b[0m\n  not found offline, try {link}\n"
+        if suggestions:
+            text += f"  did you mean: {', '.join(suggestions)}\n"
+        return text
+    lines = "\n".join(f"  {line}" for line in definition.splitlines())
+    return f"\x1b[1m{word}\x1b[0m\n{lines}\n"
+
+
+def suggest_all(words, spelling_path):
+    """{word: suggestions} for `words`, empty without a spelling index"""
+    if not words or not os.path.exists(spelling_path):
+        return {}
+    speller = Speller(spelling_path)
+    suggestions = {word: speller.suggest(word) for word in words}
+    speller.close()
+    return suggestions
+
+
+def show(text):
+    """Page `text` in less when on a terminal, else just print it"""
+    if sys.stdout.isatty():
+        try:
+            subprocess.run(["less", "-R"], input=text.encode("utf-8"), check=False)
+            return
+        except OSError:
+            pass
+    sys.stdout.write(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", default=DEFAULT_INDEX)
+    parser.add_argument("--spelling", default=DEFAULT_SPELLING)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="compile a dictionary source")
+    build.add_argument("source", help="WordNet dict dir, dictd .index or .tsv file")
+    spelling = commands.add_parser("build-spelling", help="compile a word list")
+    spelling.add_argument(
+        "word_list", nargs="?", help="`word [count]` lines (default: index words)"
+    )
+    spelling.add_argument("--max-distance", type=int, default=2)
+    spelling.add_argument("--prefix-length", type=int, default=7)
+    define = commands.add_parser("define", help="look words up")
+    define.add_argument("words", nargs="+")
+    commands.add_parser("stats", help="lookup cache counters, as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_index(read_source(args.source), args.index)
+        print(f"{count} words written to {args.index}")
+        return 0
+
+    if args.command == "build-spelling":
+        if args.word_list:
+            entries = read_word_list(args.word_list)
+        else:
+            dictionary = Dictionary(args.index)
+            entries = [(dictionary.key(i).decode(), 1) for i in range(dictionary.count)]
+            dictionary.close()
+        count = build_spelling(
+            entries, args.spelling, args.max_distance, args.prefix_length
+        )
+        print(f"{count} words written to {args.spelling}")
+        return 0
+
+    folder = os.path.dirname(os.path.abspath(args.index))
+    cache = LookupCache(os.path.join(folder, "lookups.json"), args.index)
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+        return 0
+
+    definitions = lookup_many(args.words, cache, args.index)
+    words = dict.fromkeys(args.words)
+    missing = [word for word in words if definitions[word] is None]
+    suggestions = suggest_all(missing, args.spelling)
+    show(
+        "\n".join(
+            render(word, definitions[word], suggestions.get(word, ()))
+            for word in words
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
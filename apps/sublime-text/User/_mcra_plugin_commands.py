@@ -1,50 +1,900 @@
+import array
+import bisect
+import collections
+import concurrent.futures
 import datetime
+import functools
+import itertools
+import json
+import os
 import re
 import threading
+import time
 
 import sublime
 import sublime_plugin
 
 
+class OffsetTable:
+    """Sorted buffer offsets whose tail can be shifted in O(1)
+
+    Edits shift every offset after them. Instead of rewriting the tail on
+    each keystroke, the shift is kept pending and folded into the next
+    shift at the same index, so typing in one place stays cheap.
+    """
+
+    __slots__ = ("_items", "_pivot", "_delta")
+
+    def __init__(self, items=()):
+        self._items = list(items)
+        self._pivot = len(self._items)
+        self._delta = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._items)
+        value = self._items[index]
+        return value + self._delta if index >= self._pivot else value
+
+    def __iter__(self):
+        self._flush()
+        return iter(self._items)
+
+    def _flush(self):
+        if self._delta:
+            pivot, delta = self._pivot, self._delta
+            self._items[pivot:] = [v + delta for v in self._items[pivot:]]
+        self._pivot = len(self._items)
+        self._delta = 0
+
+    def shift(self, index, delta):
+        """Add `delta` to every offset from `index` on"""
+        if not delta or index >= len(self._items):
+            return
+        if self._delta and index != self._pivot:
+            self._flush()
+        if not self._delta:
+            self._pivot = index
+        self._delta += delta
+
+    def bisect_left(self, value):
+        items, pivot = self._items, self._pivot
+        if pivot and items[pivot - 1] >= value:
+            return bisect.bisect_left(items, value, 0, pivot)
+        return bisect.bisect_left(items, value - self._delta, pivot)
+
+    def bisect_right(self, value):
+        items, pivot = self._items, self._pivot
+        if pivot and items[pivot - 1] > value:
+            return bisect.bisect_right(items, value, 0, pivot)
+        return bisect.bisect_right(items, value - self._delta, pivot)
+
+    def replace(self, start, stop, values):
+        """Replace entries [start:stop] with already-shifted `values`"""
+        pivot = self._pivot
+        if stop <= pivot:
+            self._items[start:stop] = values
+            self._pivot += len(values) - (stop - start)
+        elif start >= pivot:
+            delta = self._delta
+            self._items[start:stop] = [v - delta for v in values]
+        else:
+            self._flush()
+            self._items[start:stop] = values
+            self._pivot = len(self._items)
+
+
+def count_words(text, prev_char=" "):
+    """Number of `str.split()` words that start inside `text`
+
+    `prev_char` is the character right before `text` in the buffer, so a
+    word that runs into `text` from the left is not counted twice.
+    """
+    words = len(text.split())
+    if words and not prev_char.isspace() and not text[0].isspace():
+        words -= 1
+    return words
+
+
+class WordCounter:
+    """Word total for one buffer, patched from text-change deltas
+
+    The buffer is split into blocks of about BLOCK_SIZE characters, each
+    holding the number of words that start inside it. An edit only recounts
+    the blocks it touches, so its cost follows the size of the edit rather
+    than the size of the file.
+    """
+
+    BLOCK_SIZE = 16 * 1024
+
+    def __init__(self):
+        self.starts = OffsetTable()
+        self.words = []
+        self.size = 0
+        self.total = 0
+        self.change_count = -1
+        self.delta_change_count = -1
+        self.dirty = False
+        self.generation = 0
+        self.build = None  # In-flight chunked rebuild, see begin_rebuild()
+
+    def rebuild(self, view):
+        """Count the whole buffer from scratch"""
+        self.cancel_rebuild()
+        self.starts = OffsetTable([0])
+        self.words = [None]
+        self.size = view.size()
+        self.total = 0
+        self._recount(view, 0)
+        self.change_count = view.change_count()
+        self.dirty = False
+
+    @property
+    def counting(self):
+        return self.build is not None
+
+    def begin_rebuild(self, view):
+        """Start a chunked rebuild driven by `rebuild_step`; returns its id
+
+        Used for very large buffers, where a single substr of the whole
+        buffer would freeze the editor and allocate the file several times.
+        """
+        self.generation += 1
+        self.change_count = -1
+        self.dirty = False
+        self.build = {
+            "change_count": view.change_count(),
+            "pos": 0,
+            "prev_char": " ",
+            "starts": [],
+            "words": [],
+            "total": 0,
+        }
+        return self.generation
+
+    def cancel_rebuild(self):
+        self.generation += 1
+        self.build = None
+
+    def rebuild_step(self, view, chunk_size):
+        """Count the next chunk; True when done, None if the buffer changed"""
+        build = self.build
+        if build is None or view.change_count() != build["change_count"]:
+            self.cancel_rebuild()
+            return None
+
+        size = view.size()
+        start = build["pos"]
+        end = min(start + chunk_size, size)
+        text = view.substr(sublime.Region(start, end))
+        block_size = self.BLOCK_SIZE
+        prev_char = build["prev_char"]
+        for offset in range(0, len(text), block_size):
+            block = text[offset : offset + block_size]
+            words = count_words(block, prev_char)
+            build["starts"].append(start + offset)
+            build["words"].append(words)
+            build["total"] += words
+            prev_char = block[-1]
+        build["prev_char"] = prev_char
+        build["pos"] = end
+        if end < size:
+            return False
+
+        self.starts = OffsetTable(build["starts"] or [0])
+        self.words = build["words"] or [0]
+        self.size = size
+        self.total = build["total"]
+        self.change_count = build["change_count"]
+        self.build = None
+        return True
+
+    def estimate(self, view):
+        """Extrapolated total while a chunked rebuild is in flight"""
+        build = self.build
+        if not build or not build["pos"]:
+            return 0
+        return build["total"] * view.size() // build["pos"]
+
+    def apply_changes(self, changes, change_count):
+        """Mark the blocks touched by `changes` (sublime.TextChange list)
+
+        Nothing is read from the buffer here; `flush` recounts every dirty
+        block in one go, so a burst of edits costs a single recount.
+        """
+        if self.build is not None:
+            self.cancel_rebuild()  # Restarted on the next status update
+        if self.change_count < 0 or not changes:
+            return
+        for change in changes:
+            self._splice(change.a.pt, change.b.pt, len(change.str))
+        self.dirty = True
+        self.delta_change_count = change_count
+
+    def flush(self, view):
+        """Recount dirty blocks; False if the deltas haven't caught up yet"""
+        change_count = view.change_count()
+        if not self.dirty:
+            return True
+        if change_count != self.delta_change_count:
+            return False
+
+        index = 0
+        words = self.words
+        while True:
+            try:
+                index = words.index(None, index)
+            except ValueError:
+                break
+            blocks = len(words)
+            self._recount(view, index)
+            index += max(len(words) - blocks + 1, 0)
+
+        self.dirty = False
+        if self.size != view.size() or view.change_count() != change_count:
+            # Edited while we were reading; the offsets can't be trusted
+            self.change_count = -1
+        else:
+            self.change_count = change_count
+        return True
+
+    def _splice(self, begin, end, inserted):
+        """Merge the blocks covering [begin, end] into one dirty block"""
+        starts, words = self.starts, self.words
+        first = max(starts.bisect_right(begin) - 1, 0)
+        last = max(starts.bisect_right(end) - 1, first)
+        if last + 1 < len(words) and starts[last + 1] - starts[first] < (
+            self.BLOCK_SIZE // 2
+        ):
+            # Absorb the next block so small leftovers don't pile up
+            last += 1
+        delta = inserted - (end - begin)
+
+        for word_count in words[first : last + 1]:
+            if word_count is not None:
+                self.total -= word_count
+        starts.replace(first + 1, last + 1, [])
+        words[first : last + 1] = [None]
+        starts.shift(first + 1, delta)
+        self.size += delta
+        return first
+
+    def count_range(self, view, begin, end):
+        """Words in `view.substr(Region(begin, end)).split()`
+
+        Blocks fully inside the range reuse their stored counts, so only the
+        two partial blocks at the edges are read from the buffer.
+        """
+        current = not self.dirty and self.change_count == view.change_count()
+        if not current or end - begin < 2 * self.BLOCK_SIZE:
+            return len(view.substr(sublime.Region(begin, end)).split())
+
+        first = self.starts.bisect_right(begin)
+        last = self.starts.bisect_right(end) - 1
+        head_end = self.starts[first]
+        tail_start = self.starts[last]
+        head = view.substr(sublime.Region(begin, head_end))
+        tail = view.substr(sublime.Region(tail_start, end))
+        prev_char = view.substr(tail_start - 1)
+        return (
+            count_words(head)
+            + sum(self.words[first:last])
+            + count_words(tail, head[-1:] if head_end == tail_start else prev_char)
+        )
+
+    def _recount(self, view, index):
+        """Count dirty block `index`, splitting it if it grew too large"""
+        start = self.starts[index]
+        end = self.starts[index + 1] if index + 1 < len(self.words) else self.size
+        block_size = self.BLOCK_SIZE
+
+        if start == end and len(self.words) > 1:
+            # Everything in this block was deleted
+            self.starts.replace(index, index + 1, [])
+            del self.words[index]
+            return
+
+        new_starts, new_words = [], []
+        prev_char = view.substr(start - 1) if start else " "
+        for chunk_start in range(start, max(end, start + 1), block_size):
+            chunk_end = min(chunk_start + block_size, end)
+            text = view.substr(sublime.Region(chunk_start, chunk_end))
+            new_starts.append(chunk_start)
+            new_words.append(count_words(text, prev_char))
+            if text:
+                prev_char = text[-1]
+
+        self.starts.replace(index, index + 1, new_starts)
+        self.words[index : index + 1] = new_words
+        self.total += sum(new_words)
+
+
+# Heading lines of a markdown file
+HEADING_LINE = re.compile(r"^(#{1,6})[^\S\n]+(.*?)[^\S\n]*$", re.M)
+
+# Heading, task and Added lines of a tasks.md file
+TASK_LINE = re.compile(
+    r"^(?:(#{1,6})[^\S\n]+(.*?)"
+    r"|[^\S\n]*- \[([ x])\] (.*?)"
+    r"|_Added: (\d{4}-\d{2}-\d{2} \d{2}:\d{2})_)[^\S\n]*$",
+    re.M,
+)
+
+
+def is_tasks_file(view):
+    file_name = view.file_name()
+    return bool(file_name) and file_name.endswith("tasks.md")
+
+
+class LineIndex:
+    """Offsets and parsed entries of the lines matching PATTERN in one buffer
+
+    Patched from text-change deltas like WordCounter: an edit drops the
+    entries of the lines it touches and shifts the rest, and `flush` only
+    reads those lines back, so the buffer is parsed once.
+    """
+
+    PATTERN = None
+
+    def __init__(self):
+        self.offsets = OffsetTable()  # line starts
+        self.lengths = []
+        self.entries = []
+        self.dirty = []  # (begin, end) spans to read back
+        self.change_count = -1
+        self.delta_change_count = -1
+
+    def entry(self, match):
+        """The entry stored for one PATTERN match"""
+        return match.groups()
+
+    def removed(self, entries):
+        """Hook for subclasses keeping totals over the entries"""
+
+    def added(self, entries):
+        """Hook for subclasses keeping totals over the entries"""
+
+    def rebuild(self, view):
+        """Index the whole buffer from scratch"""
+        self.removed(self.entries)
+        self.offsets = OffsetTable()
+        self.lengths, self.entries = [], []
+        self.dirty = []
+        self._scan(view, 0, view.size())
+        self.change_count = view.change_count()
+
+    def _scan(self, view, begin, end):
+        """Index the whole lines in [begin, end], replacing their entries"""
+        first = self.offsets.bisect_left(begin)
+        stop = self.offsets.bisect_left(end + 1)
+        self.removed(self.entries[first:stop])
+
+        offsets, lengths, entries = [], [], []
+        text = view.substr(sublime.Region(begin, end))
+        for m in self.PATTERN.finditer(text):
+            offsets.append(begin + m.start())
+            lengths.append(m.end() - m.start())
+            entries.append(self.entry(m))
+
+        self.offsets.replace(first, stop, offsets)
+        self.lengths[first:stop] = lengths
+        self.entries[first:stop] = entries
+        self.added(entries)
+
+    def apply_changes(self, changes, change_count):
+        """Drop the entries of the lines touched by `changes`"""
+        if self.change_count < 0 or not changes:
+            return
+        for change in changes:
+            begin, end, inserted = change.a.pt, change.b.pt, len(change.str)
+            delta = inserted - (end - begin)
+
+            # The entry of the line holding `begin` ends at or after it
+            first = self.offsets.bisect_right(begin) - 1
+            if first < 0 or self.offsets[first] + self.lengths[first] < begin:
+                first += 1
+            stop = self.offsets.bisect_right(end)
+            self.removed(self.entries[first:stop])
+            self.offsets.replace(first, stop, [])
+            del self.lengths[first:stop]
+            del self.entries[first:stop]
+            self.offsets.shift(first, delta)
+
+            def moved(pt):
+                if pt <= begin:
+                    return pt
+                return pt + delta if pt >= end else begin + inserted
+
+            self.dirty = [(moved(lo), moved(hi)) for lo, hi in self.dirty]
+            self.dirty.append((begin, begin + inserted))
+        self.delta_change_count = change_count
+
+    def flush(self, view):
+        """Read back the edited lines; False if the deltas haven't caught up"""
+        if not self.dirty:
+            return True
+        if view.change_count() != self.delta_change_count:
+            return False
+        for begin, end in sorted(self.dirty):
+            lines = view.line(sublime.Region(begin, min(end, view.size())))
+            self._scan(view, lines.begin(), lines.end())
+        self.dirty = []
+        self.change_count = view.change_count()
+        return True
+
+    def update(self, view):
+        """Bring the index up to date with `view`, building it the first time
+
+        Like WordCounter, an index whose deltas haven't caught up is left as
+        it is: rebuilding it then would shift the new offsets a second time
+        once the pending batch arrives. That batch marks it dirty again.
+        """
+        if self.change_count < 0:
+            self.rebuild(view)
+        else:
+            self.flush(view)
+        return self
+
+
+class TaskIndex(LineIndex):
+    """Headings, tasks and Added stamps of one tasks.md buffer
+
+    Entries are (kind, text), kind one of heading/open/done/added, with
+    running open/done totals so the status bar never needs a rescan.
+    """
+
+    PATTERN = TASK_LINE
+
+    def __init__(self):
+        super().__init__()
+        self.open = 0
+        self.done = 0
+
+    def entry(self, match):
+        heading, title, state, task, added = match.groups()
+        if heading:
+            return ("heading", f"{heading} {title}")
+        if state:
+            return ("done" if state == "x" else "open", task)
+        return ("added", added)
+
+    def removed(self, entries):
+        self._count(entries, -1)
+
+    def added(self, entries):
+        self._count(entries, 1)
+
+    def _count(self, entries, sign):
+        for kind, _ in entries:
+            if kind == "open":
+                self.open += sign
+            elif kind == "done":
+                self.done += sign
+
+    def headings(self):
+        """[offset, title, added, open, done] per heading, in buffer order"""
+        headings = [[0, "(top)", None, 0, 0]]
+        for offset, (kind, text) in zip(self.offsets, self.entries):
+            if kind == "heading":
+                headings.append([offset, text, None, 0, 0])
+            elif kind == "added":
+                if headings[-1][2] is None:
+                    headings[-1][2] = text
+            elif kind == "open":
+                headings[-1][3] += 1
+            else:
+                headings[-1][4] += 1
+        if headings[0][3:] == [0, 0] and len(headings) > 1:
+            del headings[0]
+        return headings
+
+    def open_tasks(self):
+        """(heading, offset, task) of every open task, oldest heading first
+
+        Headings come from `headings()`; tasks under one without an Added
+        stamp come last.
+        """
+        headings = self.headings()
+        starts = [heading[0] for heading in headings]
+        tasks = []
+        for offset, (kind, text) in zip(self.offsets, self.entries):
+            if kind == "open":
+                index = max(bisect.bisect_right(starts, offset) - 1, 0)
+                tasks.append((headings[index], offset, text))
+        tasks.sort(key=lambda task: (task[0][2] is None, task[0][2] or "", task[1]))
+        return tasks
+
+
+class HeadingIndex(LineIndex):
+    """Heading outline of one markdown buffer: (level, text) per heading"""
+
+    PATTERN = HEADING_LINE
+
+    def entry(self, match):
+        marks, text = match.groups()
+        return (len(marks), text)
+
+    def at(self, pt):
+        """Position of the heading whose section holds `pt`, or -1"""
+        return self.offsets.bisect_right(pt) - 1
+
+    def next_after(self, pt):
+        """Offset of the first heading after the line of `pt`, or None"""
+        index = self.offsets.bisect_right(pt)
+        return self.offsets[index] if index < len(self.offsets) else None
+
+    def previous_before(self, pt):
+        """Offset of the last heading starting before `pt`, or None"""
+        index = self.offsets.bisect_left(pt) - 1
+        return self.offsets[index] if index >= 0 else None
+
+
+def load_setting(name, default):
+    """Read one of our `mcra_*` keys from the user preferences"""
+    return sublime.load_settings("Preferences.sublime-settings").get(name, default)
+
+
+class Profiler:
+    """Latency histograms for the plugin's hooks and commands
+
+    Callbacks decorated with `@profiled` are timed while `enabled` is set
+    (`mcra_profiler_enabled` or the `mcra_profiler_toggle` command). When
+    disabled, the only cost is one attribute check per call.
+    """
+
+    BUCKETS = 24  # Powers of two of microseconds, up to ~8s
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.stats = {}  # callback name -> dict, see record()
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+    def record(self, name, seconds, size):
+        micros = seconds * 1_000_000
+        bucket = min(int(micros).bit_length(), self.BUCKETS - 1)
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = {
+                    "calls": 0,
+                    "total_us": 0.0,
+                    "max_us": 0.0,
+                    "max_size": 0,
+                    "size_at_max": 0,
+                    "histogram": [0] * self.BUCKETS,
+                }
+            stats["calls"] += 1
+            stats["total_us"] += micros
+            stats["histogram"][bucket] += 1
+            stats["max_size"] = max(stats["max_size"], size)
+            if micros >= stats["max_us"]:
+                stats["max_us"] = micros
+                stats["size_at_max"] = size
+
+    @staticmethod
+    def percentile(histogram, fraction):
+        """Upper bound (us) of the bucket holding the given fraction of calls"""
+        target = fraction * sum(histogram)
+        seen = 0
+        for bucket, calls in enumerate(histogram):
+            seen += calls
+            if calls and seen >= target:
+                return float(1 << bucket)
+        return 0.0
+
+    def report(self):
+        """Per-callback summary, slowest p95 first"""
+        with self.lock:
+            rows = []
+            for name, stats in self.stats.items():
+                histogram = list(stats["histogram"])
+                max_us = round(stats["max_us"], 1)
+                rows.append(
+                    {
+                        "name": name,
+                        "calls": stats["calls"],
+                        "mean_us": round(stats["total_us"] / stats["calls"], 1),
+                        "p50_us": min(self.percentile(histogram, 0.50), max_us),
+                        "p95_us": min(self.percentile(histogram, 0.95), max_us),
+                        "max_us": max_us,
+                        "max_size": stats["max_size"],
+                        "size_at_max": stats["size_at_max"],
+                        "histogram": histogram,
+                    }
+                )
+        rows.sort(key=lambda row: (row["p95_us"], row["max_us"]), reverse=True)
+        return rows
+
+
+profiler = Profiler()
+
+
+def _profiled_size(args):
+    """Buffer size at call time, from the view a hook or command runs on"""
+    owner = args[0] if args else None
+    view = getattr(owner, "view", None)  # TextCommand
+    if view is None and len(args) > 1 and hasattr(args[1], "change_count"):
+        view = args[1]  # EventListener hook
+    if view is None and getattr(owner, "buffer", None) is not None:
+        view = owner.buffer.primary_view()  # TextChangeListener
+    return view.size() if view is not None else 0
+
+
+def profiled(func):
+    """Time `func` with the global profiler while it's enabled"""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not profiler.enabled:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.record(name, time.perf_counter() - start, _profiled_size(args))
+
+    return wrapper
+
+
+class StatusWorkQueue:
+    """Coalesces status events into one recount per view
+
+    Events only mark a view dirty. A single `set_timeout_async` worker
+    waits until no event arrived for `mcra_status_quiet_ms` and then runs
+    `handler` once for each dirty view, however many events it got.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.lock = threading.Lock()
+        self.dirty = {}  # view_id -> view
+        self.last_event = 0.0
+        self.scheduled = False
+        self.events_received = 0
+        self.recounts_done = 0
+
+    def quiet_ms(self):
+        return load_setting("mcra_status_quiet_ms", 150)
+
+    def mark_dirty(self, view):
+        with self.lock:
+            self.events_received += 1
+            self.dirty[view.id()] = view
+            self.last_event = time.monotonic()
+            if self.scheduled:
+                return
+            self.scheduled = True
+        sublime.set_timeout_async(self._drain, self.quiet_ms())
+
+    def discard(self, view):
+        with self.lock:
+            self.dirty.pop(view.id(), None)
+
+    def _drain(self):
+        with self.lock:
+            quiet = self.quiet_ms() / 1000
+            remaining = self.last_event + quiet - time.monotonic()
+            if remaining > 0:
+                # More events arrived since we were scheduled
+                sublime.set_timeout_async(self._drain, int(remaining * 1000) + 1)
+                return
+            views = list(self.dirty.values())
+            self.dirty.clear()
+            self.scheduled = False
+
+        for view in views:
+            if view.is_valid():
+                self.handler(view)
+                self.recounts_done += 1
+
+    def stats(self):
+        """Events received vs. recounts done since the plugin loaded"""
+        with self.lock:
+            return {
+                "events_received": self.events_received,
+                "recounts_done": self.recounts_done,
+                "pending": len(self.dirty),
+            }
+
+
+class SelectionStats:
+    """Words/chars/lines of the current selections, cached per region
+
+    Results are keyed on (begin, end) and only kept while the buffer's
+    change_count stays the same, so moving one cursor among thousands only
+    counts the region that moved.
+    """
+
+    def __init__(self):
+        self.cache = {}  # view_id -> (change_count, {(begin, end): stats})
+
+    def compute(self, view, counter=None):
+        """Totals for the non-empty selections, or None if there are none"""
+        change_count = view.change_count()
+        cached_count, old = self.cache.get(view.id(), (None, {}))
+        if cached_count != change_count:
+            old = {}
+
+        new = {}
+        for region in view.sel():
+            if region.empty():
+                continue
+            key = (region.begin(), region.end())
+            stats = old.get(key)
+            if stats is None:
+                stats = self._region_stats(view, counter, *key)
+            new[key] = stats
+
+        self.cache[view.id()] = (change_count, new)
+        if not new:
+            return None
+        words, chars, lines = (sum(column) for column in zip(*new.values()))
+        return len(new), words, chars, lines
+
+    def _region_stats(self, view, counter, begin, end):
+        if counter is not None:
+            words = counter.count_range(view, begin, end)
+        else:
+            words = len(view.substr(sublime.Region(begin, end)).split())
+        # A selection of whole lines ends right after the last newline
+        last = end - 1 if view.substr(end - 1) == "\n" else end
+        lines = view.rowcol(last)[0] - view.rowcol(begin)[0] + 1
+        return words, end - begin, lines
+
+    def forget(self, view):
+        self.cache.pop(view.id(), None)
+
+
 class StatusBarManager:
     """Manages status bar updates"""
 
     def __init__(self):
-        self.timer = None
+        self.generation = 0
         self.is_running = False
+        self.counters = {}  # buffer_id -> WordCounter
+        self.tasks = {}  # buffer_id -> TaskIndex, for tasks.md files
+        self.lock = threading.Lock()
+        self.queue = StatusWorkQueue(self.update_count_status)
+        self.selection_stats = SelectionStats()
 
     def start(self):
         if not self.is_running:
             self.is_running = True
-            self.update_status()
+            self.generation += 1
+            self.update_status(self.generation)
 
     def stop(self):
+        # Pending timeouts can't be cancelled, so they check the generation
+        # they were scheduled for and bail out instead.
         self.is_running = False
-        if self.timer:
-            self.timer.cancel()
+        self.generation += 1
 
-    def update_status(self):
-        if not self.is_running:
+    def update_status(self, generation):
+        if not self.is_running or generation != self.generation:
             return
 
-        # Update datetime for all views
+        date_time = self.date_time()
+        for view in self.visible_views():
+            view.set_status("datetime", date_time)
+            counter = self.counters.get(view.buffer_id())
+            if counter is None or counter.change_count != view.change_count():
+                self.update_count_status(view)
+
+        # The clock only shows minutes, so wake up right after the next one
         now = datetime.datetime.now()
-        date_time = now.strftime("%d%b%y %H:%M").lower()
+        delay = (60 - now.second) * 1000 - now.microsecond // 1000 + 50
+        sublime.set_timeout_async(lambda: self.update_status(generation), delay)
 
-        for window in sublime.windows():
-            for view in window.views():
-                view.set_status("datetime", date_time)
-                self.update_count_status(view)
+    def date_time(self):
+        return datetime.datetime.now().strftime("%d%b%y %H:%M").lower()
 
-        # Schedule next update
-        self.timer = threading.Timer(1.0, self.update_status)
-        self.timer.start()
+    def visible_views(self):
+        """Views currently shown in some group of some window"""
+        for window in sublime.windows():
+            for group in range(window.num_groups()):
+                view = window.active_view_in_group(group)
+                if view is not None:
+                    yield view
 
+    @profiled
     def update_count_status(self, view):
         """Update character and word count in status bar"""
-        total_chars = view.size()
-        total_words = len(view.substr(sublime.Region(0, view.size())).split())
-        view.set_status("word_count", f"{total_words} words, {total_chars} chars")
+        if is_tasks_file(view):
+            self.update_task_status(view)
+
+        with self.lock:
+            counter = self.counters.get(view.buffer_id())
+            if counter is None:
+                counter = self.counters[view.buffer_id()] = WordCounter()
+            if not counter.flush(view):
+                return  # The text change listener will mark it dirty again
+            if counter.change_count != view.change_count():
+                if view.size() > load_setting("mcra_large_file_chars", 4_000_000):
+                    if not counter.counting:
+                        generation = counter.begin_rebuild(view)
+                        sublime.set_timeout_async(
+                            lambda: self._count_large_file(view, counter, generation)
+                        )
+                    return
+                counter.rebuild(view)
+            total = counter.total
+            selection = self.selection_stats.compute(view, counter)
+
+        view.set_status("word_count", f"{total} words, {view.size()} chars")
+        self.publish_selection(view, selection)
+
+    def task_index(self, view):
+        """The up-to-date task index of `view`; call with the lock held"""
+        index = self.tasks.get(view.buffer_id())
+        if index is None:
+            index = self.tasks[view.buffer_id()] = TaskIndex()
+        return index.update(view)
+
+    def update_task_status(self, view):
+        with self.lock:
+            index = self.task_index(view)
+            open_tasks, done_tasks = index.open, index.done
+        view.set_status("tasks", f"Tasks: {open_tasks} open, {done_tasks} done")
+
+    def publish_selection(self, view, selection):
+        if selection is None:
+            view.erase_status("selection_count")
+            return
+        regions, words, chars, lines = selection
+        prefix = f"{regions} sels: " if regions > 1 else "Sel: "
+        view.set_status(
+            "selection_count", f"{prefix}{words} words, {chars} chars, {lines} lines"
+        )
+
+    def _count_large_file(self, view, counter, generation):
+        """Count one chunk of a large buffer, then yield to other work"""
+        chunk_size = load_setting("mcra_count_chunk_chars", 1024 * 1024)
+        with self.lock:
+            if counter.generation != generation or not view.is_valid():
+                return  # Cancelled by an edit or the view closed
+            done = counter.rebuild_step(view, chunk_size)
+            total = counter.total if done else counter.estimate(view)
+
+        if done is None:
+            self.queue.mark_dirty(view)
+        elif done:
+            view.set_status("word_count", f"{total} words, {view.size()} chars")
+        else:
+            view.set_status(
+                "word_count", f"~{total} words (counting…), {view.size()} chars"
+            )
+            sublime.set_timeout_async(
+                lambda: self._count_large_file(view, counter, generation)
+            )
+
+    def apply_changes(self, buffer, changes):
+        """Mark the word count of `buffer` dirty from a text change batch"""
+        with self.lock:
+            counter = self.counters.get(buffer.id())
+            if counter is not None:
+                counter.apply_changes(changes, buffer.change_count())
+            tasks = self.tasks.get(buffer.id())
+            if tasks is not None:
+                tasks.apply_changes(changes, buffer.change_count())
+
+    def forget_view(self, view):
+        """Drop what is kept for a closed view"""
+        self.queue.discard(view)
+        self.selection_stats.forget(view)
+
+    def forget(self, buffer_id):
+        """Drop the cached counts of a closed buffer"""
+        with self.lock:
+            self.counters.pop(buffer_id, None)
+            self.tasks.pop(buffer_id, None)
 
 
 # Global status bar manager
@@ -53,6 +903,7 @@ status_manager = StatusBarManager()
 
 def plugin_loaded():
     """Called when plugin is loaded"""
+    profiler.enabled = load_setting("mcra_profiler_enabled", False)
     status_manager.start()
 
 
@@ -64,56 +915,440 @@ def plugin_unloaded():
 class UpdateStatusListener(sublime_plugin.EventListener):
     """Listen for events that should trigger status updates"""
 
+    @profiled
     def on_selection_modified(self, view):
-        status_manager.update_count_status(view)
+        status_manager.queue.mark_dirty(view)
 
+    @profiled
     def on_activated(self, view):
-        status_manager.update_count_status(view)
+        view.set_status("datetime", status_manager.date_time())
+        status_manager.queue.mark_dirty(view)
 
+    @profiled
     def on_modified(self, view):
-        status_manager.update_count_status(view)
+        status_manager.queue.mark_dirty(view)
+
+    @profiled
+    def on_close(self, view):
+        status_manager.forget_view(view)
+
+
+class BracketIndex:
+    """Matched (), [] and {} pairs of one buffer, kept across edits
+
+    The buffer is only scanned as far as a lookup needs. Edits that neither
+    insert nor remove a bracket just shift the offsets after them; any other
+    edit drops the entries from the edit on, to be rescanned when needed.
+    """
+
+    CHUNK_SIZE = 256 * 1024
+    PATTERN = re.compile(r"[()\[\]{}]")
+    OPENER_OF = {ord(")"): ord("("), ord("]"): ord("["), ord("}"): ord("{")}
+
+    def __init__(self, change_count):
+        self.positions = OffsetTable()
+        self.chars = bytearray()
+        self.match = array.array("q")  # Index of the matching entry, or -1
+        self.outer = array.array("q")  # Innermost open entry around it, or -1
+        self.stack = []  # Entries still open at `scanned`
+        self.scanned = 0
+        self.change_count = change_count
+
+    def _after(self, index):
+        """Innermost open entry right after entry `index`"""
+        if index < 0:
+            return -1
+        return index if self.chars[index] not in self.OPENER_OF else self.outer[index]
+
+    def scan(self, view, end):
+        """Index brackets up to at least `end`, or the end of the buffer"""
+        size = view.size()
+        chars, match, outer, stack = self.chars, self.match, self.outer, self.stack
+        opener_of = self.OPENER_OF
+        while self.scanned < min(end, size):
+            stop = min(size, self.scanned + self.CHUNK_SIZE)
+            text = view.substr(sublime.Region(self.scanned, stop))
+            found = []
+            base = self.scanned
+            index = len(chars)
+            for m in self.PATTERN.finditer(text):
+                char = ord(m.group())
+                top = stack[-1] if stack else -1
+                opener = opener_of.get(char)
+                if opener is None:
+                    stack.append(index)
+                    match.append(-1)
+                elif top >= 0 and chars[top] == opener:
+                    stack.pop()
+                    match[top] = index
+                    match.append(top)
+                    top = stack[-1] if stack else -1
+                else:
+                    match.append(-1)  # Stray closing bracket
+                outer.append(top)
+                chars.append(char)
+                found.append(base + m.start())
+                index += 1
+            self.positions.replace(len(self.positions), len(self.positions), found)
+            self.scanned = stop
+
+    def _local_match(self, view, begin, end):
+        """Whether `begin` and `end` pair up, scanning only the text between
+
+        A pair only depends on the text after its opening bracket, so this
+        agrees with the index without scanning the buffer before `begin`.
+        """
+        if view.substr(begin) not in "([{":
+            return False
+        stack = []
+        for m in self.PATTERN.finditer(view.substr(sublime.Region(begin, end + 1))):
+            char = ord(m.group())
+            opener = self.OPENER_OF.get(char)
+            if opener is None:
+                stack.append(char)
+            elif stack and stack[-1] == opener:
+                stack.pop()
+                if not stack:
+                    return m.start() == end - begin
+        return False
+
+    def is_pair(self, view, begin, end):
+        """Whether `begin` and `end` hold a matched pair of brackets"""
+        if self.scanned <= end and end - begin < self.CHUNK_SIZE:
+            return self._local_match(view, begin, end)
+        self.scan(view, end + 1)
+        index = self.positions.bisect_left(begin)
+        if index == len(self.positions) or self.positions[index] != begin:
+            return False
+        other = self.match[index]
+        return other > index and self.positions[other] == end
+
+    def enclosing(self, view, begin, end):
+        """(open, close) offsets of the pairs around [begin, end), innermost first"""
+        self.scan(view, begin + 1)
+        index = self._after(self.positions.bisect_right(begin) - 1)
+        while index >= 0:
+            while self.match[index] < 0 and self.scanned < view.size():
+                self.scan(view, self.scanned + self.CHUNK_SIZE)
+            other = self.match[index]
+            if other >= 0 and self.positions[other] + 1 >= end:
+                yield self.positions[index], self.positions[other]
+            index = self.outer[index]
+
+    def apply_changes(self, changes, change_count):
+        """Shift or drop entries after a text change batch"""
+        for change in changes:
+            begin, end, inserted = change.a.pt, change.b.pt, change.str
+            if begin >= self.scanned:
+                continue
+            index = self.positions.bisect_left(begin)
+            removes = index < len(self.positions) and self.positions[index] < end
+            if removes or end > self.scanned or self.PATTERN.search(inserted):
+                self._truncate(index, begin)
+            else:
+                delta = len(inserted) - (end - begin)
+                self.positions.shift(index, delta)
+                self.scanned += delta
+        self.change_count = change_count
+
+    def _truncate(self, index, offset):
+        self.positions.replace(index, len(self.positions), [])
+        del self.chars[index:]
+        del self.match[index:]
+        del self.outer[index:]
+
+        # Rebuild the open stack from the last entry that survived
+        stack = []
+        top = self._after(index - 1)
+        while top >= 0:
+            stack.append(top)
+            self.match[top] = -1
+            top = self.outer[top]
+        stack.reverse()
+        self.stack = stack
+        self.scanned = offset
+
+
+QUOTE_PATTERN = re.compile(r"\\.|[\"'`]")
+SUBWORD_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+# Longer lines are tokenized on every call, so the token cache stays small
+CACHED_LINE_CHARS = 1024
+
+
+def line_tokens(text):
+    """Word, identifier, sub-word and quote spans of one line
+
+    Offsets are relative to the start of the line. Lines up to
+    CACHED_LINE_CHARS are cached on their text, so edits elsewhere never
+    invalidate them.
+    """
+    if len(text) > CACHED_LINE_CHARS:
+        return tokenize_line(text)
+    return cached_line_tokens(text)
+
+
+def tokenize_line(text):
+    """line_tokens(), uncached"""
+    words = [m.span() for m in re.finditer(r"\S+", text)]
+    idents = [m.span() for m in re.finditer(r"\w+", text)]
+    subwords = [m.span() for m in SUBWORD_PATTERN.finditer(text)]
+
+    # A sub-word boundary is where one sub-word ends and the identifier goes on
+    boundaries = []
+    for (_, end), (start, _) in zip(subwords, subwords[1:]):
+        if all(c == "_" for c in text[end:start]):
+            boundaries.append(end)
+
+    quotes = []
+    open_at = {}
+    for m in QUOTE_PATTERN.finditer(text):
+        quote, pos = m.group(), m.start()
+        if len(quote) > 1:
+            continue  # Escaped character
+        if quote == "'" and 0 < pos < len(text) - 1:
+            if text[pos - 1].isalnum() and text[pos + 1].isalnum():
+                continue  # Apostrophe, as in "don't"
+        if quote in open_at:
+            quotes.append((open_at.pop(quote), pos))
+        else:
+            open_at[quote] = pos
+
+    return {
+        "words": words,
+        "word_starts": [start for start, _ in words],
+        "idents": idents,
+        "subwords": subwords,
+        "boundaries": boundaries,
+        "quotes": quotes,
+    }
+
+
+cached_line_tokens = functools.lru_cache(maxsize=4096)(tokenize_line)
+
+
+def first_non_space(view, begin, end):
+    """Offset of the first non-whitespace character in [begin, end), or None"""
+    pt, window = begin, 256
+    while pt < end:
+        stop = min(end, pt + window)
+        text = view.substr(sublime.Region(pt, stop))
+        skipped = len(text) - len(text.lstrip())
+        if skipped < len(text):
+            return pt + skipped
+        pt, window = stop, window * 4
+    return None
+
+
+def last_non_space(view, begin, end):
+    """Offset of the last non-whitespace character in [begin, end), or None"""
+    pt, window = end, 256
+    while pt > begin:
+        start = max(begin, pt - window)
+        text = view.substr(sublime.Region(start, pt))
+        kept = len(text.rstrip())
+        if kept:
+            return start + kept - 1
+        pt, window = start, window * 4
+    return None
+
+
+class BufferIndexes:
+    """Indexes per buffer, fed by BufferChangeListener
+
+    Subclasses add a `get(view, ...)` that builds or reuses the index of
+    the view's buffer in `indexes`.
+    """
+
+    def __init__(self):
+        self.indexes = {}  # buffer_id -> index
+
+    def apply_changes(self, buffer, changes):
+        index = self.indexes.get(buffer.id())
+        if index is not None:
+            index.apply_changes(changes, buffer.change_count())
+
+    def forget(self, buffer_id):
+        self.indexes.pop(buffer_id, None)
+
+
+class StructureIndex(BufferIndexes):
+    """Bracket indexes per buffer"""
+
+    def get(self, view):
+        """The bracket index of `view`, reset if it missed some edits"""
+        index = self.indexes.get(view.buffer_id())
+        if index is None or index.change_count != view.change_count():
+            index = self.indexes[view.buffer_id()] = BracketIndex(view.change_count())
+        return index
+
+
+# Global structure index
+structure_index = StructureIndex()
+
+
+class SelectionRing:
+    """Fixed-capacity ring of selection states for one view
+
+    Each state is one compact `array` of (begin - previous end, end - begin)
+    pairs, using the smallest signed typecode that fits. Pushing past
+    capacity overwrites the oldest slot in place, so a push is O(cursors)
+    and never copies the rest of the history.
+    """
+
+    TYPECODES = ("h", "i", "q")
+
+    def __init__(self, capacity):
+        self.slots = [None] * capacity
+        self.head = 0  # slot of the oldest state
+        self.count = 0
+        self.nbytes = 0
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def encode(cls, regions):
+        values = []
+        previous = 0
+        for region in regions:
+            begin, end = region.begin(), region.end()
+            values.append(begin - previous)
+            values.append(end - begin)
+            previous = end
+        low, high = min(values, default=0), max(values, default=0)
+        for typecode in cls.TYPECODES:
+            bits = array.array(typecode).itemsize * 8 - 1
+            if -(1 << bits) <= low and high < (1 << bits):
+                return array.array(typecode, values)
+        raise OverflowError("selection offsets do not fit in 64 bits")
+
+    @staticmethod
+    def decode(state):
+        regions = []
+        end = 0
+        for i in range(0, len(state), 2):
+            begin = end + state[i]
+            end = begin + state[i + 1]
+            regions.append(sublime.Region(begin, end))
+        return regions
+
+    @staticmethod
+    def size_of(state):
+        return len(state) * state.itemsize
+
+    def push(self, state):
+        """Store `state` as the newest entry; returns bytes freed by overwriting"""
+        capacity = len(self.slots)
+        freed = 0
+        if self.count == capacity:
+            freed = self.drop_oldest()
+        self.slots[(self.head + self.count) % capacity] = state
+        self.count += 1
+        self.nbytes += self.size_of(state)
+        return freed
+
+    def pop(self):
+        """Remove and return the newest state, or None when empty"""
+        if not self.count:
+            return None
+        index = (self.head + self.count - 1) % len(self.slots)
+        state, self.slots[index] = self.slots[index], None
+        self.count -= 1
+        self.nbytes -= self.size_of(state)
+        return state
+
+    def drop_oldest(self):
+        """Forget the oldest state; returns the bytes freed"""
+        if not self.count:
+            return 0
+        state, self.slots[self.head] = self.slots[self.head], None
+        self.head = (self.head + 1) % len(self.slots)
+        self.count -= 1
+        size = self.size_of(state)
+        self.nbytes -= size
+        return size
 
 
 # Global selection history tracker
 class SelectionHistoryManager:
+    """Per-view selection rings under one global byte budget
+
+    Views are kept in least-recently-used order. When the total goes over
+    `mcra_selection_history_bytes`, the oldest states of the least recently
+    used views are dropped first.
+    """
+
     def __init__(self):
-        self.history = {}  # view_id -> list of selection states
+        self.history = collections.OrderedDict()  # view_id -> SelectionRing
+        self.nbytes = 0
+
+    @property
+    def capacity(self):
+        return max(1, load_setting("mcra_selection_history_size", 50))
+
+    @property
+    def budget(self):
+        return load_setting("mcra_selection_history_bytes", 16 * 1024 * 1024)
 
     def push_selections(self, view):
         """Save current selections to history"""
         view_id = view.id()
-        if view_id not in self.history:
-            self.history[view_id] = []
+        ring = self.history.get(view_id)
+        if ring is None or len(ring.slots) != self.capacity:
+            self._drop(view_id)
+            ring = self.history[view_id] = SelectionRing(self.capacity)
+        self.history.move_to_end(view_id)
 
-        # Convert selections to tuples for storage
-        current_selections = [(r.begin(), r.end()) for r in view.sel()]
-        self.history[view_id].append(current_selections)
-
-        # Limit history size to prevent memory issues
-        if len(self.history[view_id]) > 50:
-            self.history[view_id] = self.history[view_id][-50:]
+        state = SelectionRing.encode(view.sel())
+        self.nbytes += SelectionRing.size_of(state) - ring.push(state)
+        self._enforce_budget()
 
     def pop_selections(self, view):
         """Restore previous selections from history"""
         view_id = view.id()
-        if view_id not in self.history or not self.history[view_id]:
+        ring = self.history.get(view_id)
+        if ring is None or not len(ring):
             return False
+        self.history.move_to_end(view_id)
 
         # Get the previous selection state
-        previous_selections = self.history[view_id].pop()
+        previous_selections = ring.pop()
+        self.nbytes -= SelectionRing.size_of(previous_selections)
 
         # Apply the previous selections
         view.sel().clear()
-        for start, end in previous_selections:
-            view.sel().add(sublime.Region(start, end))
+        view.sel().add_all(SelectionRing.decode(previous_selections))
 
         return True
 
     def clear_history(self, view):
         """Clear history for a view"""
-        view_id = view.id()
-        if view_id in self.history:
-            self.history[view_id].clear()
+        self._drop(view.id())
+
+    def forget(self, view):
+        """Drop everything kept for a closed view"""
+        self._drop(view.id())
+
+    def _drop(self, view_id):
+        ring = self.history.pop(view_id, None)
+        if ring is not None:
+            self.nbytes -= ring.nbytes
+
+    def _enforce_budget(self):
+        # Oldest states of the least recently used views go first; the
+        # newest state of the most recent view is always kept
+        budget = self.budget
+        for view_id in list(self.history):
+            if self.nbytes <= budget:
+                return
+            ring = self.history[view_id]
+            is_newest = view_id == next(reversed(self.history))
+            while self.nbytes > budget and len(ring) > (1 if is_newest else 0):
+                self.nbytes -= ring.drop_oldest()
+            if not len(ring):
+                del self.history[view_id]
 
 
 # Global instance
@@ -123,17 +1358,23 @@ selection_history = SelectionHistoryManager()
 class SelectionHistoryListener(sublime_plugin.EventListener):
     """Track expand_selection commands to build history"""
 
+    @profiled
     def on_text_command(self, view, command_name, args):
         # Track when expand_selection is about to run
         if command_name == "expand_selection":
             selection_history.push_selections(view)
         return None
 
+    @profiled
     def on_selection_modified(self, view):
         # Clear history if user manually changes selection
         # (with a small delay to avoid clearing during expand/shrink operations)
         sublime.set_timeout_async(lambda: self.maybe_clear_history(view), 100)
 
+    @profiled
+    def on_close(self, view):
+        selection_history.forget(view)
+
     def maybe_clear_history(self, view):
         # Only clear if we're not in the middle of an expand/shrink operation
         # This is a simple heuristic - in practice, manual selection changes
@@ -144,6 +1385,7 @@ class SelectionHistoryListener(sublime_plugin.EventListener):
 class ShrinkSelectionCommand(sublime_plugin.TextCommand):
     """Shrink selection using history (like VSCode)"""
 
+    @profiled
     def run(self, edit):
         # Try to restore previous selection from history
         if selection_history.pop_selections(self.view):
@@ -170,187 +1412,455 @@ class ShrinkSelectionCommand(sublime_plugin.TextCommand):
         """Fallback heuristic shrinking when no history available"""
         start = region.begin()
         end = region.end()
-        text = view.substr(region)
+        first = first_non_space(view, start, end)
+        if first is None:
+            # Only whitespace selected
+            return sublime.Region(start, end - 1 if end - start > 1 else start)
+        last = last_non_space(view, first, end)
 
         # Strategy 1: If selection includes surrounding brackets/quotes, remove them
-        stripped = text.strip()
-        if len(stripped) >= 2:
-            bracket_pairs = [
-                ("(", ")"),
-                ("[", "]"),
-                ("{", "}"),
-                ('"', '"'),
-                ("'", "'"),
-                ("`", "`"),
-            ]
-
-            for open_br, close_br in bracket_pairs:
-                if stripped.startswith(open_br) and stripped.endswith(close_br):
-                    # Find actual bracket positions in original text
-                    open_pos = text.find(open_br)
-                    close_pos = text.rfind(close_br)
-                    if close_pos > open_pos:
-                        inner_text = text[open_pos + 1 : close_pos]
-                        if inner_text.strip():  # Only shrink if there's content inside
-                            return sublime.Region(
-                                start + open_pos + 1, start + close_pos
-                            )
-
-        # Strategy 2: Multi-line to single line
-        lines = text.splitlines()
-        if len(lines) > 1:
-            # Find first non-empty line
-            for line in lines:
-                if line.strip():
-                    line_start = text.find(line.strip())
-                    return sublime.Region(
-                        start + line_start, start + line_start + len(line.strip())
-                    )
-
-        # Strategy 3: Multiple words to single word
-        words = text.split()
-        if len(words) > 1:
-            first_word = words[0]
-            word_pos = text.find(first_word)
-            return sublime.Region(start + word_pos, start + word_pos + len(first_word))
-
-        # Strategy 4: CamelCase word splitting
-        camel_match = re.search(r"[a-z][A-Z]", text)
-        if camel_match:
-            split_pos = camel_match.start() + 1
-            return sublime.Region(start, start + split_pos)
+        if last - first >= 2 and first_non_space(view, first + 1, last) is not None:
+            open_br, close_br = view.substr(first), view.substr(last)
+            if open_br in "([{":
+                if structure_index.get(view).is_pair(view, first, last):
+                    return sublime.Region(first + 1, last)
+            elif open_br in "\"'`" and open_br == close_br:
+                return sublime.Region(first + 1, last)
+
+        # Strategy 2: Multi-line to its first non-empty line
+        line = view.line(first)
+        if view.line(start).end() < end - 1:
+            line_last = last_non_space(view, first, min(line.end(), end))
+            return sublime.Region(first, line_last + 1)
+
+        # Strategy 3: Multiple words to the first word
+        tokens = line_tokens(view.substr(line))
+        index = bisect.bisect_right(tokens["word_starts"], first - line.begin()) - 1
+        word_end = min(end, line.begin() + tokens["words"][index][1])
+        if last >= word_end:
+            return sublime.Region(first, word_end)
+
+        # Strategy 4: camelCase/snake_case word to its first sub-word
+        boundaries = tokens["boundaries"]
+        index = bisect.bisect_right(boundaries, start - line.begin())
+        if index < len(boundaries) and line.begin() + boundaries[index] < end:
+            return sublime.Region(start, line.begin() + boundaries[index])
 
         # Strategy 5: Character shrinking
-        if len(text) > 1:
+        if end - start > 1:
             return sublime.Region(start, end - 1)
 
         # Can't shrink further
         return sublime.Region(start, start)
 
 
-class FindUnderExpandSkipBackwardCommand(sublime_plugin.TextCommand):
-    """Move focus backwards through multiple selections (like VSCode's behavior)"""
+class StructuralExpandSelectionCommand(sublime_plugin.TextCommand):
+    """Grow selections to the enclosing sub-word, word, quotes, brackets or line"""
 
+    @profiled
     def run(self, edit):
         view = self.view
-        selections = list(view.sel())
-
-        if not selections:
-            return
+        selection_history.push_selections(view)
+        regions = [self.expand_region(view, region) for region in view.sel()]
+        view.sel().clear()
+        view.sel().add_all(regions)
+
+    def candidates(self, view, begin, end):
+        """Spans around [begin, end) that the selection could grow to"""
+        line = view.line(begin)
+        if end <= line.end():
+            offset = line.begin()
+            tokens = line_tokens(view.substr(line))
+            for key in ("subwords", "idents"):
+                spans = tokens[key]
+                index = bisect.bisect_right(spans, (begin - offset, len(line))) - 1
+                if index >= 0:
+                    yield offset + spans[index][0], offset + spans[index][1]
+            for open_pos, close_pos in tokens["quotes"]:
+                yield offset + open_pos + 1, offset + close_pos
+                yield offset + open_pos, offset + close_pos + 1
+            first = first_non_space(view, line.begin(), line.end())
+            if first is not None:
+                yield first, last_non_space(view, first, line.end()) + 1
+            yield line.begin(), line.end()
+
+        for level, (open_pos, close_pos) in enumerate(
+            structure_index.get(view).enclosing(view, begin, end)
+        ):
+            yield open_pos + 1, close_pos
+            yield open_pos, close_pos + 1
+            if level:
+                break  # Two levels always hold something bigger
+
+        yield view.line(begin).begin(), view.line(end).end()
+        yield 0, view.size()
+
+    def expand_region(self, view, region):
+        begin, end = region.begin(), region.end()
+        best = None
+        for span in self.candidates(view, begin, end):
+            if span[0] <= begin and end <= span[1] and span[1] - span[0] > end - begin:
+                if best is None or span[1] - span[0] < best[1] - best[0]:
+                    best = span
+        return sublime.Region(*best) if best else region
+
+
+class OccurrenceIndex:
+    """Matches of one needle in a buffer, found lazily around the cursors
+
+    Matches are searched for outward from where they are needed, with
+    incremental `view.find` calls forwards and growing windows backwards,
+    so reaching a nearby match costs the distance travelled rather than
+    the buffer size. Their begin offsets and the spans already searched are
+    kept, and patched from text-change deltas, so holding a skip key only
+    searches new ground.
+    """
+
+    WINDOW = 16 * 1024
+
+    def __init__(self, view, needle, whole_word=False, case_sensitive=True):
+        self.key = (needle, whole_word, case_sensitive)
+        self.size = len(needle)
+        self.whole_word = whole_word
+        self.begins = OffsetTable()
+        self.searched = []  # Sorted (lo, hi): matches beginning inside are known
+        self.change_count = view.change_count()
+
+        pattern = re.escape(needle)
+        if whole_word:
+            pattern = r"\b" + pattern + r"\b"
+        self.regex = re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+        self.find_pattern = pattern if whole_word else needle
+        self.find_flags = 0 if whole_word else sublime.LITERAL
+        if not case_sensitive:
+            self.find_flags |= sublime.IGNORECASE
+
+        # Matches of a needle that can overlap itself depend on where the
+        # search started, so they are not kept between commands
+        folded = needle if case_sensitive else needle.lower()
+        self.reusable = whole_word or not any(
+            folded[:size] == folded[-size:] for size in range(1, len(needle))
+        )
+
+    def _span_at(self, pt):
+        """The searched span holding `pt`, or None"""
+        index = bisect.bisect_left(self.searched, (pt + 1,)) - 1
+        if index >= 0 and pt < self.searched[index][1]:
+            return self.searched[index]
+        return None
 
-        # Get the text from the first selection to search for
-        if selections[0].empty():
-            return
+    def _mark_searched(self, lo, hi):
+        spans = self.searched
+        start = bisect.bisect_left(spans, (lo,))
+        if start and spans[start - 1][1] >= lo:
+            start -= 1
+        stop = start
+        while stop < len(spans) and spans[stop][0] <= hi:
+            stop += 1
+        if start < stop:
+            lo, hi = min(lo, spans[start][0]), max(hi, spans[stop - 1][1])
+        spans[start:stop] = [(lo, hi)]
+
+    def _add(self, begin):
+        index = self.begins.bisect_left(begin)
+        if index == len(self.begins) or self.begins[index] != begin:
+            self.begins.replace(index, index, [begin])
+
+    def next_at(self, view, pt):
+        """Begin of the first match starting at or after `pt`, or None"""
+        size = view.size()
+        while pt <= size:
+            span = self._span_at(pt)
+            if span is not None:
+                index = self.begins.bisect_left(pt)
+                if index < len(self.begins) and self.begins[index] < span[1]:
+                    return self.begins[index]
+                pt = span[1]
+                continue
+            region = view.find(self.find_pattern, pt, self.find_flags)
+            if region is None or region.begin() < 0:
+                self._mark_searched(pt, size + 1)
+                return None
+            self._add(region.begin())
+            self._mark_searched(pt, region.begin() + 1)
+            return region.begin()
+        return None
 
-        search_text = view.substr(selections[0])
-        if not search_text:
-            return
+    def prev_at(self, view, pt):
+        """Begin of the last match ending at or before `pt`, or None"""
+        last = pt - self.size  # Latest begin that still ends by `pt`
+        window = self.WINDOW
+        while last >= 0:
+            span = self._span_at(last)
+            if span is not None:
+                index = self.begins.bisect_right(last) - 1
+                if index >= 0 and self.begins[index] >= span[0]:
+                    return self.begins[index]
+                last = span[0] - 1
+                continue
 
-        # This is the key insight: we want to move the "focus" (last selection)
-        # to a previous occurrence while keeping other selections
+            # Read one extra character on each side for \b
+            lo = max(0, last + 1 - window)
+            offset = max(0, lo - 1)
+            text = view.substr(sublime.Region(offset, last + self.size + 1))
+            found = None
+            for m in self.regex.finditer(text, lo - offset):
+                if offset + m.start() > last:
+                    break
+                found = offset + m.start()
+            if found is not None:
+                self._add(found)
+                self._mark_searched(found, last + 1)
+                return found
+            self._mark_searched(lo, last + 1)
+            last = lo - 1
+            window *= 2
+        return None
 
-        # Find all occurrences in the document
-        all_regions = view.find_all(search_text, sublime.LITERAL)
+    def search_all(self, view):
+        """Find every match at once, for callers that want all of them"""
+        if self.searched != [(0, view.size() + 1)]:
+            self.begins = OffsetTable(
+                region.begin()
+                for region in view.find_all(self.find_pattern, self.find_flags)
+            )
+            self.searched = [(0, view.size() + 1)]
+
+    def apply_changes(self, changes, change_count):
+        """Forget matches and searched spans around a text change batch"""
+        margin = 1 if self.whole_word else 0  # \b looks one character out
+        for change in changes:
+            begin, end, inserted = change.a.pt, change.b.pt, len(change.str)
+            delta = inserted - (end - begin)
+            first = self.begins.bisect_left(begin - self.size + 1 - margin)
+            self.begins.replace(first, self.begins.bisect_left(end + margin), [])
+            self.begins.shift(first, delta)
+
+            def moved(pt):
+                if pt <= begin:
+                    return pt
+                return pt + delta if pt >= end else begin + inserted
+
+            stale_lo = begin - self.size + 1 - margin
+            stale_hi = begin + inserted + margin
+            spans = []
+            for lo, hi in self.searched:
+                lo, hi = moved(lo), moved(hi)
+                if lo < min(hi, stale_lo):
+                    spans.append((lo, min(hi, stale_lo)))
+                if max(lo, stale_hi) < hi:
+                    spans.append((max(lo, stale_hi), hi))
+            self.searched = spans
+        self.change_count = change_count
+
+    def occurrences(self, view, start, forward=True):
+        """Match begins from `start` outward, wrapping around the buffer once"""
+        wrapped = False
+        pt = start
+        while True:
+            if forward:
+                begin = self.next_at(view, pt)
+            else:
+                begin = self.prev_at(view, pt)
+            if begin is None:
+                if wrapped:
+                    return
+                wrapped = True
+                pt = 0 if forward else view.size()
+                continue
+            if wrapped and (begin >= start if forward else begin + self.size <= start):
+                return
+            yield begin
+            pt = begin + self.size if forward else begin
 
-        if len(all_regions) <= len(selections):
-            return  # No more occurrences available
 
-        # Find the last (focused) selection in the list of all occurrences
-        last_selection = selections[-1]
-        last_index = -1
+class OccurrenceIndexes(BufferIndexes):
+    """The occurrence index of the last searched needle, per buffer"""
 
-        for i, region in enumerate(all_regions):
-            if region.begin() == last_selection.begin():
-                last_index = i
-                break
+    def get(self, view, needle, whole_word=False, case_sensitive=True):
+        """Matches of `needle` in `view`, reusing what is still valid"""
+        index = self.indexes.get(view.buffer_id())
+        if (
+            index is None
+            or not index.reusable
+            or index.key != (needle, whole_word, case_sensitive)
+            or index.change_count != view.change_count()
+        ):
+            index = OccurrenceIndex(view, needle, whole_word, case_sensitive)
+            self.indexes[view.buffer_id()] = index
+        return index
 
-        if last_index == -1:
-            return
 
-        # Move to previous occurrence (with wraparound)
-        new_focus_index = (last_index - 1) % len(all_regions)
-        new_focus_region = all_regions[new_focus_index]
+# Global occurrence indexes
+occurrence_indexes = OccurrenceIndexes()
 
-        # Replace the last selection with the new focus
-        new_selections = selections[:-1] + [new_focus_region]
 
-        # Update selections
-        view.sel().clear()
-        for selection in new_selections:
-            view.sel().add(selection)
+def focused_occurrences(view, whole_word, case_sensitive):
+    """(index, focused selection) for the text of the first selection
 
-        # Show the new focused selection
-        view.show(new_focus_region)
+    None when there is nothing to search for or the focused (last)
+    selection is not itself a match.
+    """
+    selections = view.sel()
+    if not selections or selections[0].empty():
+        return None
 
+    # Get the text from the first selection to search for
+    search_text = view.substr(selections[0])
+    if not search_text:
+        return None
 
-class FindUnderExpandSkipForwardCommand(sublime_plugin.TextCommand):
-    """Move focus forwards through multiple selections (like VSCode's behavior)"""
+    index = occurrence_indexes.get(view, search_text, whole_word, case_sensitive)
+    last_selection = selections[-1]
+    if not index.regex.fullmatch(view.substr(last_selection)):
+        return None
+    return index, last_selection
+
+
+def skip_focused_selection(view, step, count=1, whole_word=False, case_sensitive=True):
+    """Move the last selection `count` unselected matches along, keeping the others"""
+    found = focused_occurrences(view, whole_word, case_sensitive)
+    if found is None:
+        return
+    index, last_selection = found
+    selections = view.sel()
+
+    # Walk outward from the focused selection, skipping selected matches
+    if step > 0:
+        start = last_selection.end()
+    else:
+        start = last_selection.begin()
+    new_focus_region = None
+    for begin in index.occurrences(view, start, forward=step > 0):
+        region = sublime.Region(begin, begin + index.size)
+        if selections.contains(region):
+            continue
+        new_focus_region = region
+        count -= 1
+        if count <= 0:
+            break
+    if new_focus_region is None:
+        return  # No more occurrences available
+
+    # Replace the last selection with the new focus
+    selections.subtract(last_selection)
+    selections.add(new_focus_region)
+
+    # Show the new focused selection
+    view.show(new_focus_region)
 
-    def run(self, edit):
-        view = self.view
-        selections = list(view.sel())
 
-        if not selections:
-            return
+class FindUnderExpandSkipBackwardCommand(sublime_plugin.TextCommand):
+    """Move focus backwards through multiple selections (like VSCode's behavior)"""
 
-        # Get the text from the first selection to search for
-        if selections[0].empty():
-            return
+    @profiled
+    def run(self, edit, count=1, whole_word=False, case_sensitive=True):
+        # Move the "focus" (last selection) to a previous occurrence
+        # while keeping the other selections
+        skip_focused_selection(self.view, -1, count, whole_word, case_sensitive)
 
-        search_text = view.substr(selections[0])
-        if not search_text:
-            return
 
-        # Find all occurrences in the document
-        all_regions = view.find_all(search_text, sublime.LITERAL)
+class FindUnderExpandSkipForwardCommand(sublime_plugin.TextCommand):
+    """Move focus forwards through multiple selections (like VSCode's behavior)"""
 
-        if len(all_regions) <= len(selections):
-            return  # No more occurrences available
+    @profiled
+    def run(self, edit, count=1, whole_word=False, case_sensitive=True):
+        skip_focused_selection(self.view, 1, count, whole_word, case_sensitive)
 
-        # Find the last (focused) selection in the list of all occurrences
-        last_selection = selections[-1]
-        last_index = -1
 
-        for i, region in enumerate(all_regions):
-            if region.begin() == last_selection.begin():
-                last_index = i
-                break
+class FindUnderExpandAddRemainingCommand(sublime_plugin.TextCommand):
+    """Select every occurrence of the first selection that isn't selected yet"""
 
-        if last_index == -1:
+    @profiled
+    def run(self, edit, whole_word=False, case_sensitive=True):
+        view = self.view
+        found = focused_occurrences(view, whole_word, case_sensitive)
+        if found is None:
             return
+        index = found[0]
 
-        # Move to next occurrence (with wraparound)
-        new_focus_index = (last_index + 1) % len(all_regions)
-        new_focus_region = all_regions[new_focus_index]
+        # Every match is wanted, so find them in one pass; the selection
+        # merges the ones already selected
+        index.search_all(view)
+        size = index.size
+        view.sel().add_all(
+            sublime.Region(begin, begin + size) for begin in index.begins
+        )
 
-        # Replace the last selection with the new focus
-        new_selections = selections[:-1] + [new_focus_region]
 
-        # Update selections
-        view.sel().clear()
-        for selection in new_selections:
-            view.sel().add(selection)
-
-        # Show the new focused selection
-        view.show(new_focus_region)
+# Leading whitespace plus the task marker of every non-blank line
+TASK_MARKER = re.compile(r"^([^\S\n]*)(?:(- \[x\] |- \[ \] |- )|(?=\S))", re.M)
+NEXT_TASK_MARKER = {"- [x] ": "- ", "- [ ] ": "- [x] ", "- ": "- [ ] ", None: "- "}
 
 
 class ToggleMarkdownTaskCommand(sublime_plugin.TextCommand):
     """Toggle between '- text', '- [ ] text', and '- [x] text' in markdown"""
 
+    @profiled
     def run(self, edit):
         view = self.view
+        regions = list(view.sel())
+
+        # Every line covered by a selection, once, as runs of contiguous lines
+        runs = []
+        for region in regions:
+            end = region.end()
+            if end > region.begin() and view.substr(end - 1) == "\n":
+                end -= 1  # Whole-line selections end at the start of the next line
+            begin, end = view.line(region.begin()).begin(), view.line(end).end()
+            if runs and begin <= runs[-1][1] + 1:
+                runs[-1][1] = max(runs[-1][1], end)
+            else:
+                runs.append([begin, end])
+
+        # Toggle each run in one regex pass and one replace, last run first,
+        # so the lines between runs are left alone
+        edits = []  # (offset, old marker length, new marker)
+        for begin, end in reversed(runs):
+            text = view.substr(sublime.Region(begin, end))
+            new_text = self.toggle_run(text, begin, edits)
+            if new_text != text:
+                view.replace(edit, sublime.Region(begin, end), new_text)
+
+        self.restore_selections(regions, edits)
+
+    def toggle_run(self, text, offset, edits):
+        """Toggle every line of `text`, recording the marker edits"""
+        if "\n" not in text and not text.strip():
+            # A lone blank line still becomes a bullet
+            edits.append((offset + len(text), 0, "- "))
+            return self.toggle_task_state(text)
+
+        def toggle(match):
+            marker = match.group(2)
+            new_marker = NEXT_TASK_MARKER[marker]
+            edits.append((offset + match.end(1), len(marker or ""), new_marker))
+            return match.group(1) + new_marker
+
+        return TASK_MARKER.sub(toggle, text)
+
+    def restore_selections(self, regions, edits):
+        """Move the selections along with the toggled markers"""
+        edits.sort()
+        offsets = [offset for offset, _, _ in edits]
+        shifts = list(itertools.accumulate(len(new) - old for _, old, new in edits))
+
+        def moved(pt):
+            index = bisect.bisect_right(offsets, pt) - 1
+            if index < 0:
+                return pt
+            offset, old, new = edits[index]
+            before = shifts[index - 1] if index else 0
+            if pt == offset and old:
+                return pt + before  # Right before a replaced marker
+            if pt < offset + old or pt == offset:
+                return offset + before + len(new)  # Inside it, or at an insert
+            return pt + shifts[index]
 
-        for region in view.sel():
-            # Get the line containing the cursor
-            line_region = view.line(region)
-            line_text = view.substr(line_region)
-
-            # Determine current state and next state
-            new_text = self.toggle_task_state(line_text)
-
-            # Replace the line
-            view.replace(edit, line_region, new_text)
+        self.view.sel().clear()
+        self.view.sel().add_all(
+            sublime.Region(moved(region.a), moved(region.b)) for region in regions
+        )
 
     def toggle_task_state(self, line_text):
         """Toggle between the three task states"""
@@ -382,10 +1892,9 @@ class ToggleMarkdownTaskCommand(sublime_plugin.TextCommand):
 class MarkdownNewHeadingCommand(sublime_plugin.TextCommand):
     """Create new heading in markdown files - different behavior for tasks.md"""
 
+    @profiled
     def run(self, edit):
-        file_name = self.view.file_name()
-
-        if file_name and file_name.endswith("tasks.md"):
+        if is_tasks_file(self.view):
             # tasks.md: heading without time, with Added timestamp
             self._create_tasks_heading(edit)
         else:
@@ -459,9 +1968,382 @@ class MarkdownNewHeadingCommand(sublime_plugin.TextCommand):
         return self.view.match_selector(0, "text.html.markdown")
 
 
+class MarkdownOpenTasksCommand(sublime_plugin.TextCommand):
+    """Quick panel of the open tasks in tasks.md, oldest heading first"""
+
+    @profiled
+    def run(self, edit):
+        with status_manager.lock:
+            tasks = status_manager.task_index(self.view).open_tasks()
+        if not tasks:
+            sublime.status_message("No open tasks")
+            return
+
+        items = []
+        for (_, title, added, open_tasks, done_tasks), _, text in tasks:
+            detail = f"{title or '(untitled)'} · {open_tasks} open, {done_tasks} done"
+            if added:
+                detail += f" · Added {added}"
+            items.append(sublime.QuickPanelItem(text or "(empty task)", detail))
+
+        def on_done(index):
+            if index < 0:
+                return
+            # Caret at the start of the task line
+            offset = tasks[index][1]
+            self.view.sel().clear()
+            self.view.sel().add(sublime.Region(offset))
+            self.view.show_at_center(offset)
+
+        self.view.window().show_quick_panel(items, on_done)
+
+    def is_enabled(self):
+        return is_tasks_file(self.view)
+
+
+# The `- [ ]`/`- [x]` states ToggleMarkdownTaskCommand cycles through
+TASK_ITEM = re.compile(r"^[^\S\n]*- \[([ x])\] (.*?)[^\S\n]*$", re.M)
+
+
+def parse_task_file(path):
+    """[line, done, text] of every task in the markdown file at `path`"""
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    except OSError:
+        return []
+    tasks = []
+    line, last = 1, 0
+    for m in TASK_ITEM.finditer(text):
+        line += text.count("\n", last, m.start())
+        last = m.start()
+        tasks.append([line, m.group(1) == "x", m.group(2)])
+    return tasks
+
+
+def parse_batch(paths):
+    """parse_task_file over a batch of paths, one pool job"""
+    return [parse_task_file(path) for path in paths]
+
+
+def markdown_files(folder):
+    """(path, mtime_ns, size) of the markdown files under `folder`
+
+    Hidden files and folders (.git, .obsidian, ...) are skipped.
+    """
+    stack = [folder]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith(".md") and entry.is_file():
+                        stat = entry.stat()
+                        yield entry.path, stat.st_mtime_ns, stat.st_size
+                except OSError:
+                    continue
+
+
+class ProjectTasks:
+    """Tasks of the markdown files under the project folders
+
+    Parsed tasks are cached in memory and on disk per path, keyed by
+    (mtime, size), so a repeat scan only stats the files and re-reads the
+    changed ones. Those are parsed in a thread pool.
+    """
+
+    def __init__(self):
+        self.cache = None  # path -> [mtime_ns, size, tasks]
+        self.lock = threading.Lock()
+
+    @property
+    def cache_file(self):
+        return os.path.join(sublime.cache_path(), "mcra_project_tasks.json")
+
+    def load(self):
+        try:
+            with open(self.cache_file, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        temp = f"{self.cache_file}.tmp"
+        try:
+            with open(temp, "w", encoding="utf-8") as f:
+                # dumps() uses the C encoder, dump() streams through Python
+                f.write(json.dumps(self.cache, separators=(",", ":")))
+            os.replace(temp, self.cache_file)
+        except OSError as e:
+            print(f"mcra: could not save the task cache: {e}")
+
+    def scan(self, folders):
+        """([(folder, path, tasks)], files re-read) for every file under `folders`"""
+        with self.lock:
+            if self.cache is None:
+                self.cache = self.load()
+            cache = self.cache
+
+            files = [
+                (folder, path, mtime, size)
+                for folder in folders
+                for path, mtime, size in markdown_files(folder)
+            ]
+            stale = [
+                (path, mtime, size)
+                for _, path, mtime, size in files
+                if cache.get(path, [None, None])[:2] != [mtime, size]
+            ]
+            if stale:
+                # Batches keep the pool overhead off small files
+                paths = [path for path, _, _ in stale]
+                batches = [paths[i : i + 64] for i in range(0, len(paths), 64)]
+                with concurrent.futures.ThreadPoolExecutor() as pool:
+                    parsed = itertools.chain.from_iterable(
+                        pool.map(parse_batch, batches)
+                    )
+                    for (path, mtime, size), tasks in zip(stale, parsed):
+                        cache[path] = [mtime, size, tasks]
+
+            # Forget deleted files under the scanned folders
+            seen = {path for _, path, _, _ in files}
+            prefixes = tuple(os.path.join(folder, "") for folder in folders)
+            gone = [p for p in cache if p.startswith(prefixes) and p not in seen]
+            for path in gone:
+                del cache[path]
+
+            if stale or gone:
+                self.save()
+            found = [(folder, path, cache[path][2]) for folder, path, _, _ in files]
+            return found, len(stale)
+
+
+# Global project task cache
+project_tasks = ProjectTasks()
+
+
+class MarkdownProjectTasksCommand(sublime_plugin.WindowCommand):
+    """Every task in the markdown files of the project folders
+
+    Open tasks go to a quick panel (`show_done` adds the done ones), or to
+    an output panel with `"output": "panel"`.
+    """
+
+    def run(self, show_done=False, output="quick_panel"):
+        folders = self.window.folders()
+        if not folders:
+            sublime.status_message("No project folders to scan for tasks")
+            return
+        sublime.status_message("Scanning project tasks…")
+        sublime.set_timeout_async(lambda: self.scan(folders, show_done, output))
+
+    def scan(self, folders, show_done, output):
+        files, reread = project_tasks.scan(folders)
+
+        rows = []  # (done, relative path, path, line, text)
+        open_tasks = done_tasks = 0
+        for folder, path, tasks in files:
+            # Paths are joined onto the folder by markdown_files()
+            relative = path[len(os.path.join(folder, "")) :]
+            for line, done, text in tasks:
+                if done:
+                    done_tasks += 1
+                else:
+                    open_tasks += 1
+                if show_done or not done:
+                    rows.append((done, relative, path, line, text))
+        rows.sort()
+
+        summary = (
+            f"{open_tasks} open, {done_tasks} done tasks in {len(files)} files "
+            f"({reread} re-read)"
+        )
+        if output == "panel":
+            sublime.set_timeout(lambda: self.show_panel(rows, summary))
+        else:
+            sublime.set_timeout(lambda: self.show_quick_panel(rows, summary))
+
+    def show_quick_panel(self, rows, summary):
+        sublime.status_message(summary)
+        if not rows:
+            return
+        items = [
+            sublime.QuickPanelItem(
+                text or "(empty task)",
+                f"{relative}:{line}",
+                annotation="done" if done else "",
+            )
+            for done, relative, _, line, text in rows
+        ]
+
+        def on_done(index):
+            if index >= 0:
+                _, _, path, line, _ = rows[index]
+                self.window.open_file(f"{path}:{line}", sublime.ENCODED_POSITION)
+
+        self.window.show_quick_panel(items, on_done)
+
+    def show_panel(self, rows, summary):
+        panel = self.window.create_output_panel("mcra_tasks")
+        # Double-click (or F4) on a line opens the task
+        panel.settings().set("result_file_regex", r"^(.+?):(\d+): ")
+        lines = [summary, ""]
+        for done, _, path, line, text in rows:
+            lines.append(f"{path}:{line}: - [{'x' if done else ' '}] {text}")
+        panel.run_command("append", {"characters": "\n".join(lines) + "\n"})
+        self.window.run_command("show_panel", {"panel": "output.mcra_tasks"})
+
+
+class OutlineIndexes(BufferIndexes):
+    """Heading indexes per markdown buffer"""
+
+    def get(self, view):
+        """The up-to-date heading index of `view`"""
+        index = self.indexes.get(view.buffer_id())
+        if index is None:
+            index = self.indexes[view.buffer_id()] = HeadingIndex()
+        return index.update(view)
+
+
+# Global outline indexes
+outline_indexes = OutlineIndexes()
+
+# Everything kept per buffer: apply_changes(buffer, changes), forget(buffer_id)
+buffer_indexes = (status_manager, structure_index, occurrence_indexes, outline_indexes)
+
+
+class BufferChangeListener(sublime_plugin.TextChangeListener):
+    """Feed text-change deltas to every per-buffer index"""
+
+    @classmethod
+    def is_applicable(cls, buffer):
+        return True
+
+    @profiled
+    def on_text_changed(self, changes):
+        for indexes in buffer_indexes:
+            indexes.apply_changes(self.buffer, changes)
+
+
+class BufferCloseListener(sublime_plugin.EventListener):
+    """Drop the per-buffer indexes once the last view of a buffer closes"""
+
+    @profiled
+    def on_pre_close(self, view):
+        # Not on_close: by then the view's buffer_id() is 0
+        if len(view.buffer().views()) <= 1:
+            for indexes in buffer_indexes:
+                indexes.forget(view.buffer_id())
+
+
+class OutlineListener(sublime_plugin.EventListener):
+    """Build the heading outline of markdown files once they load"""
+
+    @profiled
+    def on_load(self, view):
+        if view.size() > load_setting("mcra_large_file_chars", 4_000_000):
+            return  # Left to the first heading jump, not to every load
+        if view.match_selector(0, "text.html.markdown"):
+            # Off the load itself, still on the main thread with the deltas
+            sublime.set_timeout(lambda: outline_indexes.get(view))
+
+
+class MarkdownGotoHeadingCommand(sublime_plugin.TextCommand):
+    """Quick panel of the headings, starting at the one holding the caret"""
+
+    @profiled
+    def run(self, edit):
+        index = outline_indexes.get(self.view)
+        if not index.entries:
+            sublime.status_message("No headings")
+            return
+
+        offsets = list(index.offsets)
+        items = [
+            sublime.QuickPanelItem("  " * (level - 1) + text, annotation=f"h{level}")
+            for level, text in index.entries
+        ]
+        current = index.at(self.view.sel()[0].b) if len(self.view.sel()) else -1
+        viewport = self.view.viewport_position()
+        selections = list(self.view.sel())
+
+        def on_highlight(position):
+            self.view.show_at_center(offsets[position])
+
+        def on_done(position):
+            if position < 0:
+                # Cancelled, put things back where they were
+                self.view.sel().clear()
+                self.view.sel().add_all(selections)
+                self.view.set_viewport_position(viewport, False)
+                return
+            jump_to(self.view, [offsets[position]])
+
+        self.view.window().show_quick_panel(
+            items,
+            on_done,
+            selected_index=max(current, 0),
+            on_highlight=on_highlight,
+        )
+
+    def is_enabled(self):
+        return self.view.match_selector(0, "text.html.markdown")
+
+
+def jump_to(view, points):
+    """Put one caret on each of `points` and show the last one"""
+    view.sel().clear()
+    view.sel().add_all([sublime.Region(pt) for pt in points])
+    view.show_at_center(points[-1])
+
+
+def jump_to_heading(view, forward):
+    """Move each caret to the next (or previous) heading, if there is one"""
+    index = outline_indexes.get(view)
+    carets = [region.b for region in view.sel()]
+    points = []
+    for pt in carets:
+        target = index.next_after(pt) if forward else index.previous_before(pt)
+        points.append(pt if target is None else target)
+    if points != carets:
+        jump_to(view, points)
+    else:
+        sublime.status_message("No more headings")
+
+
+class MarkdownNextHeadingCommand(sublime_plugin.TextCommand):
+    """Move each caret to the next heading"""
+
+    @profiled
+    def run(self, edit):
+        jump_to_heading(self.view, forward=True)
+
+    def is_enabled(self):
+        return self.view.match_selector(0, "text.html.markdown")
+
+
+class MarkdownPreviousHeadingCommand(sublime_plugin.TextCommand):
+    """Move each caret to the previous heading"""
+
+    @profiled
+    def run(self, edit):
+        jump_to_heading(self.view, forward=False)
+
+    def is_enabled(self):
+        return self.view.match_selector(0, "text.html.markdown")
+
+
 class ToggleLinePositionCommand(sublime_plugin.TextCommand):
     """Toggle current line between top, middle, bottom of screen"""
 
+    @profiled
     def run(self, edit):
         # Get current cursor position
         cursor_pos = self.view.sel()[0].begin()
@@ -489,56 +2371,250 @@ class ToggleLinePositionCommand(sublime_plugin.TextCommand):
         self.view.set_viewport_position((viewport_pos[0], target_y))
 
 
+# Selection transforms: name -> (func, skip_empty, insert). `func` gets the
+# texts of all selected regions at once and returns their replacements.
+TRANSFORMS = {}
+
+
+def register_transform(name, skip_empty=True, insert=False):
+    """Register `func(texts) -> new_texts` for `transform_selections`
+
+    With `insert`, the new text goes right before each region instead of
+    replacing it. Registered transforms can also be run by name with the
+    `mcra_transform` command.
+    """
+
+    def decorator(func):
+        TRANSFORMS[name] = (func, skip_empty, insert)
+        return func
+
+    return decorator
+
+
+def map_texts(method):
+    """A transform applying the str `method` to all texts in a single call"""
+
+    def transform(texts):
+        # "\0" survives case changes, so one call on the joined text is
+        # enough unless a text contains it
+        result = method("\0".join(texts)).split("\0")
+        if len(result) != len(texts):
+            result = [method(text) for text in texts]
+        return result
+
+    return transform
+
+
+def constant_text(make_text):
+    """A transform giving every region the same text, made once"""
+    return lambda texts: [make_text()] * len(texts)
+
+
+register_transform("upper")(map_texts(str.upper))
+register_transform("lower")(map_texts(str.lower))
+register_transform("hello_world", skip_empty=False, insert=True)(
+    constant_text(lambda: "Hello World!")
+)
+register_transform("timestamp", skip_empty=False, insert=True)(
+    constant_text(lambda: datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+)
+register_transform("date", skip_empty=False, insert=True)(
+    constant_text(lambda: datetime.datetime.now().strftime("[[%Y-%m-%d]]"))
+)
+register_transform("time", skip_empty=False, insert=True)(
+    constant_text(lambda: datetime.datetime.now().strftime("%Hh%M"))
+)
+
+
+def transform_selections(view, edit, name):
+    """Run the registered transform `name` over all selections at once
+
+    Regions are snapshotted in one pass and grouped into runs of touching
+    regions. Each run is read once and written back with a single replace,
+    back to front so earlier offsets stay valid, so text outside the
+    selections (and the bookmarks, regions and folds in it) is never
+    rewritten. The selections are then rebuilt from the tracked length
+    changes.
+    """
+    func, skip_empty, insert = TRANSFORMS[name]
+    regions = list(view.sel())
+    targets = [r for r in regions if not (skip_empty and r.empty())]
+    if not targets:
+        return
+
+    # Group touching regions into blocks: [begin, end, first, stop]
+    blocks = []
+    for index, region in enumerate(targets):
+        if blocks and region.begin() <= blocks[-1][1]:
+            blocks[-1][1] = region.end()
+            blocks[-1][3] = index + 1
+        else:
+            blocks.append([region.begin(), region.end(), index, index + 1])
+
+    # Snapshot every selected text, reading each block once
+    texts = []
+    block_texts = []
+    for begin, end, first, stop in blocks:
+        text = view.substr(sublime.Region(begin, end))
+        block_texts.append(text)
+        for region in targets[first:stop]:
+            texts.append(text[region.begin() - begin : region.end() - begin])
+
+    new_texts = func(texts)
+
+    # Write each block back with one replace, last block first
+    for (begin, end, first, stop), text in reversed(list(zip(blocks, block_texts))):
+        parts = []
+        pos = begin
+        for region, new_text in zip(targets[first:stop], new_texts[first:stop]):
+            parts.append(text[pos - begin : region.begin() - begin])
+            parts.append(new_text)
+            pos = region.begin() if insert else region.end()
+        parts.append(text[pos - begin :])
+        new_block = "".join(parts)
+        if new_block != text:
+            view.replace(edit, sublime.Region(begin, end), new_block)
+
+    # Rebuild the selections from the tracked length changes: inserted
+    # text goes before its region, replaced text becomes the selection
+    new_regions = []
+    delta = 0
+    target = iter(zip(targets, new_texts))
+    next_target, next_text = next(target)
+    for region in regions:
+        begin, end = region.begin() + delta, region.end() + delta
+        if region is next_target:
+            if insert:
+                begin += len(next_text)
+                end += len(next_text)
+                delta += len(next_text)
+            else:
+                end = begin + len(next_text)
+                delta += len(next_text) - region.size()
+            next_target, next_text = next(target, (None, None))
+        if region.a > region.b:
+            begin, end = end, begin
+        new_regions.append(sublime.Region(begin, end))
+    view.sel().clear()
+    view.sel().add_all(new_regions)
+
+
+class McraTransformCommand(sublime_plugin.TextCommand):
+    """Run a registered selection transform, e.g. {"name": "upper"}"""
+
+    @profiled
+    def run(self, edit, name):
+        transform_selections(self.view, edit, name)
+
+
 class HelloWorldCommand(sublime_plugin.TextCommand):
     """A simple command that inserts 'Hello World!' at the cursor position"""
 
+    @profiled
     def run(self, edit):
-        for region in self.view.sel():
-            self.view.insert(edit, region.begin(), "Hello World!")
+        transform_selections(self.view, edit, "hello_world")
 
 
 class UppercaseSelectionCommand(sublime_plugin.TextCommand):
     """Convert selected text to uppercase"""
 
+    @profiled
     def run(self, edit):
-        for region in self.view.sel():
-            if not region.empty():
-                text = self.view.substr(region)
-                self.view.replace(edit, region, text.upper())
+        transform_selections(self.view, edit, "upper")
 
 
 class LowercaseSelectionCommand(sublime_plugin.TextCommand):
     """Convert selected text to lowercase"""
 
+    @profiled
     def run(self, edit):
-        for region in self.view.sel():
-            if not region.empty():
-                text = self.view.substr(region)
-                self.view.replace(edit, region, text.lower())
+        transform_selections(self.view, edit, "lower")
 
 
 class InsertTimestampCommand(sublime_plugin.TextCommand):
     """Insert current timestamp at cursor position"""
 
+    @profiled
     def run(self, edit):
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        for region in self.view.sel():
-            self.view.insert(edit, region.begin(), timestamp)
+        transform_selections(self.view, edit, "timestamp")
 
 
 class InsertDateCommand(sublime_plugin.TextCommand):
     """Insert current date in [[YYYY-MM-DD]] format"""
 
+    @profiled
     def run(self, edit):
-        date_str = datetime.datetime.now().strftime("[[%Y-%m-%d]]")
-        for region in self.view.sel():
-            self.view.insert(edit, region.begin(), date_str)
+        transform_selections(self.view, edit, "date")
 
 
 class InsertTimeCommand(sublime_plugin.TextCommand):
     """Insert current time in HHhMM format"""
 
+    @profiled
     def run(self, edit):
-        time_str = datetime.datetime.now().strftime("%Hh%M")
-        for region in self.view.sel():
-            self.view.insert(edit, region.begin(), time_str)
+        transform_selections(self.view, edit, "time")
+
+
+class McraProfilerToggleCommand(sublime_plugin.ApplicationCommand):
+    """Start/stop timing the plugin's hooks and commands"""
+
+    def run(self, reset=False):
+        if reset:
+            profiler.reset()
+        profiler.enabled = not profiler.enabled
+        state = "on" if profiler.enabled else "off"
+        sublime.status_message(f"mcra profiler {state}")
+
+
+class McraProfilerReportCommand(sublime_plugin.WindowCommand):
+    """Dump profiler results to a scratch view, as a table or JSON"""
+
+    def run(self, report_format="text", path=None):
+        report = {
+            "enabled": profiler.enabled,
+            "callbacks": profiler.report(),
+            "status_queue": status_manager.queue.stats(),
+        }
+
+        if report_format == "json" or path:
+            text = json.dumps(report, indent=2)
+        else:
+            text = self.format_table(report)
+
+        if path:
+            try:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+            except OSError as e:
+                sublime.error_message(f"Could not write the profiler report: {e}")
+                return
+            sublime.status_message(f"Profiler report written to {path}")
+            return
+
+        view = self.window.new_file()
+        view.set_name("mcra profiler report")
+        view.set_scratch(True)
+        view.run_command("append", {"characters": text})
+
+    def format_table(self, report):
+        header = (
+            f"{'callback':<48} {'calls':>7} {'p50 us':>9} {'p95 us':>9} "
+            f"{'max us':>10} {'size@max':>10}"
+        )
+        lines = [header, "-" * len(header)]
+        for row in report["callbacks"]:
+            lines.append(
+                f"{row['name']:<48} {row['calls']:>7} {row['p50_us']:>9.0f} "
+                f"{row['p95_us']:>9.0f} {row['max_us']:>10.0f} "
+                f"{row['size_at_max']:>10}"
+            )
+        if not report["callbacks"]:
+            state = "on" if report["enabled"] else "off"
+            lines.append(f"(no samples, profiler is {state})")
+        queue = report["status_queue"]
+        lines.append("")
+        lines.append(
+            f"status queue: {queue['events_received']} events, "
+            f"{queue['recounts_done']} recounts, {queue['pending']} pending"
+        )
+        return "\n".join(lines) + "\n"
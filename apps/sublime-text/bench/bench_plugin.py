@@ -0,0 +1,509 @@
+"""Headless benchmarks for `User/_mcra_plugin_commands.py`.
+
+Runs the plugin against the fakes in `fake_sublime.py`, so it works on any
+Linux box without Sublime Text installed:
+
+    python3 bench_plugin.py                      # full matrix
+    python3 bench_plugin.py --quick              # small sizes only
+    python3 bench_plugin.py --only count_edit --sizes 1M,100M --cursors 1
+    python3 bench_plugin.py --compare results/previous.json
+
+Each case builds a synthetic markdown buffer of the given size, places the
+given number of cursors and times one command. Results are written as JSON
+(see --output); --compare prints the ratio against an earlier run and exits
+with status 1 when a case got slower than --threshold allows.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "User"))
+
+import fake_sublime  # noqa: E402
+
+sublime, _ = fake_sublime.install()
+
+import _mcra_plugin_commands as plugin  # noqa: E402
+
+# Recount as soon as the fake timers run, the quiet period is wall-clock time
+sublime.load_settings("Preferences.sublime-settings").set("mcra_status_quiet_ms", 0)
+
+NEEDLE = "fooBar"
+
+LINE_TEMPLATES = [
+    "- [ ] {w} {w} " + NEEDLE + " task with (some {w} words) and more\n",
+    "- [x] done {w} item `{w}_{w}` ok\n",
+    "- plain {w} bullet about {w} and {w}\n",
+    '{w} {w} {w}, "{w} quoted {w}" then [{w}] ' + NEEDLE + " again.\n",
+    "## 14h33 - {w} heading\n",
+    "\n",
+    "someCamelCase {w}_snake_case {w} {{ {w}: {w} }}\n",
+]
+
+WORDS = [
+    "alpha", "beta", "gamma", "delta", "lorem", "ipsum", "dolor", "sit",
+    "amet", "journal", "notes", "review", "deploy", "logs", "parser",
+]
+
+SIZES = {
+    "1K": 1024,
+    "64K": 64 * 1024,
+    "1M": 1024 * 1024,
+    "16M": 16 * 1024 * 1024,
+    "100M": 100 * 1024 * 1024,
+}
+
+
+def parse_size(text):
+    if text in SIZES:
+        return SIZES[text]
+    units = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+    if text[-1:].upper() in units:
+        return int(float(text[:-1]) * units[text[-1:].upper()])
+    return int(text)
+
+
+def make_text(size, seed=0):
+    """Deterministic markdown-ish text of exactly `size` characters"""
+    rng = random.Random(seed)
+    unit = []
+    unit_size = 0
+    while unit_size < 64 * 1024:
+        line = rng.choice(LINE_TEMPLATES)
+        line = re.sub(r"\{w\}", lambda _: rng.choice(WORDS), line)
+        unit.append(line)
+        unit_size += len(line)
+    unit = "".join(unit)
+    text = unit * (size // len(unit) + 1)
+    return text[:size]
+
+
+class Corpus:
+    """Buffer text plus where the needle and its lines are, per size"""
+
+    def __init__(self, size):
+        self.text = make_text(size)
+        self.needles = [m.start() for m in re.finditer(NEEDLE, self.text)]
+
+    def spread(self, positions, count):
+        """`count` positions spread evenly over the buffer"""
+        if not positions:
+            return []
+        count = min(count, len(positions))
+        step = len(positions) / count
+        return [positions[int(i * step)] for i in range(count)]
+
+    def needle_regions(self, count):
+        return [
+            sublime.Region(pos, pos + len(NEEDLE))
+            for pos in self.spread(self.needles, count)
+        ]
+
+    def line_starts(self, count):
+        return [
+            sublime.Region(self.text.rfind("\n", 0, pos) + 1)
+            for pos in self.spread(self.needles, count)
+        ]
+
+    def line_regions(self, count):
+        regions = []
+        for pos in self.spread(self.needles, count):
+            start = self.text.rfind("\n", 0, pos) + 1
+            end = self.text.find("\n", pos)
+            regions.append(sublime.Region(start, end if end != -1 else len(self.text)))
+        return regions
+
+
+def new_view(corpus, regions, file_name="/tmp/bench/notes.md"):
+    window = sublime.active_window()
+    for view in window.views():
+        view.close()
+    view = window.open_view(corpus.text, file_name=file_name)
+    view.sel().clear()
+    view.sel().add_all(regions)
+    fake_sublime.run_timeouts()
+    return view
+
+
+def command_case(name, place):
+    """A case that runs TextCommand `name` with cursors from `place`"""
+
+    def setup(corpus, cursors):
+        view = new_view(corpus, place(corpus, cursors))
+        return view, lambda: view.run_command(name)
+
+    return setup
+
+
+def count_cold(corpus, cursors):
+    view = new_view(corpus, corpus.needle_regions(cursors))
+
+    def run():
+        plugin.status_manager.update_count_status(view)
+        fake_sublime.run_timeouts()
+
+    return view, run
+
+
+def count_edit(corpus, cursors):
+    view = new_view(corpus, corpus.needle_regions(cursors))
+    plugin.status_manager.update_count_status(view)
+    fake_sublime.run_timeouts()
+    view.insert(None, view.size() // 2, "x ")
+    return view, lambda: plugin.status_manager.update_count_status(view)
+
+
+def insert_racing(view, pt, text, before_delivery):
+    """Insert `text`, calling `before_delivery` before its text change batch
+    reaches the listeners, like the status worker running mid-edit"""
+    view.insert(fake_sublime.Edit(view), pt, text)
+    before_delivery()
+    view._flush_changes()
+
+
+def task_edit(corpus, cursors):
+    """tasks.md open/done totals after typing a task, once the index is built"""
+    view = new_view(corpus, corpus.line_starts(cursors), "/tmp/bench/tasks.md")
+    plugin.status_manager.update_task_status(view)
+    insert_racing(
+        view,
+        view.size() // 2,
+        "- [ ] x\n",
+        lambda: plugin.status_manager.update_task_status(view),
+    )
+    return view, lambda: plugin.status_manager.update_task_status(view)
+
+
+def close_view(corpus, cursors):
+    """Closing the last view of a tasks.md buffer, with every index built"""
+    view = new_view(corpus, corpus.line_starts(cursors), "/tmp/bench/tasks.md")
+    plugin.status_manager.update_count_status(view)
+    plugin.structure_index.get(view)
+    plugin.occurrence_indexes.get(view, "the")
+    plugin.outline_indexes.get(view)
+    return view, view.close
+
+
+def heading_jump(corpus, cursors):
+    """100 markdown_next_heading presses after an edit, outline already built"""
+    view = new_view(corpus, corpus.line_starts(cursors))
+    view.run_command("markdown_next_heading")
+    insert_racing(
+        view,
+        view.size() // 2,
+        "## 14h33 - new\n",
+        lambda: plugin.outline_indexes.get(view),
+    )
+
+    def run():
+        for _ in range(100):
+            view.run_command("markdown_next_heading")
+
+    return view, run
+
+
+def expand_shrink(corpus, cursors):
+    """expand_selection pushes history, shrink_selection pops it"""
+    view = new_view(corpus, corpus.needle_regions(cursors))
+
+    def run():
+        view.run_command("expand_selection", {"to": "line"})
+        view.run_command("shrink_selection")
+
+    return view, run
+
+
+def shrink_block(corpus, cursors):
+    """shrink_selection without history on `cursors` equal multi-line blocks"""
+    size = len(corpus.text)
+    step = size // cursors
+    regions = [sublime.Region(i * step, (i + 1) * step) for i in range(cursors)]
+    view = new_view(corpus, regions)
+    return view, lambda: view.run_command("shrink_selection")
+
+
+def structural_expand(corpus, cursors):
+    """Second structural_expand_selection, once the bracket index is built"""
+    view = new_view(corpus, corpus.needle_regions(cursors))
+    view.run_command("structural_expand_selection")
+    return view, lambda: view.run_command("structural_expand_selection")
+
+
+def skip_held(corpus, cursors):
+    """100 more find_under_expand_skip_forward presses, as if the key is held"""
+    view = new_view(corpus, corpus.needle_regions(cursors))
+    view.run_command("find_under_expand_skip_forward")
+
+    def run():
+        for _ in range(100):
+            view.run_command("find_under_expand_skip_forward")
+
+    return view, run
+
+
+def add_remaining(corpus, cursors):
+    """find_under_expand_add_remaining from `cursors` needles"""
+    view = new_view(corpus, corpus.needle_regions(cursors))
+    return view, lambda: view.run_command("find_under_expand_add_remaining")
+
+
+def toggle_all(corpus, cursors):
+    """toggle_markdown_task with the whole buffer selected"""
+    view = new_view(corpus, [sublime.Region(0, len(corpus.text))])
+    return view, lambda: view.run_command("toggle_markdown_task")
+
+
+def project_folder(corpus):
+    """The corpus split into 4 KiB markdown files, written once per corpus"""
+    if getattr(corpus, "folder", None) is None:
+        corpus.folder = tempfile.mkdtemp(prefix="mcra-bench-")
+        step = 4096
+        for i in range(0, len(corpus.text), step):
+            name = os.path.join(corpus.folder, f"{i // step % 100:02}", f"{i}.md")
+            os.makedirs(os.path.dirname(name), exist_ok=True)
+            with open(name, "w", encoding="utf-8") as f:
+                f.write(corpus.text[i : i + step])
+    return corpus.folder
+
+
+def project_tasks_case(warm):
+    """markdown_project_tasks over the corpus files, cold or on a repeat run"""
+
+    def setup(corpus, cursors):
+        view = new_view(corpus, [])
+        window = view.window()
+        window.set_folders([project_folder(corpus)])
+        if warm:
+            window.run_command("markdown_project_tasks")
+            fake_sublime.run_timeouts()
+        else:
+            plugin.project_tasks.cache = None
+            if os.path.exists(plugin.project_tasks.cache_file):
+                os.remove(plugin.project_tasks.cache_file)
+
+        def run():
+            window.run_command("markdown_project_tasks")
+            fake_sublime.run_timeouts()
+
+        return view, run
+
+    return setup
+
+
+def check_count(view):
+    expected = len(view.substr(sublime.Region(0, view.size())).split())
+    status = view.get_status("word_count")
+    assert status.startswith(f"{expected} words"), (status, expected)
+
+
+def check_tasks(view):
+    text = view.substr(sublime.Region(0, view.size()))
+    expected = len(re.findall(r"^[^\S\n]*- \[ \] .*$", text, re.M))
+    status = view.get_status("tasks")
+    assert status.startswith(f"Tasks: {expected} open"), (status, expected)
+    with plugin.status_manager.lock:
+        check_line_index(plugin.status_manager.task_index(view), view)
+
+
+def check_line_index(index, view):
+    """`index`, patched from deltas, agrees with one built from scratch"""
+    fresh = type(index)()
+    fresh.rebuild(view)
+    assert list(index.offsets) == list(fresh.offsets), "offsets differ"
+    assert index.entries == fresh.entries, "entries differ"
+
+
+def check_closed(view):
+    # The view is closed, so its buffer_id() is 0: nothing may be left
+    manager = plugin.status_manager
+    assert not manager.counters, f"{len(manager.counters)} word counters left"
+    assert not manager.tasks, f"{len(manager.tasks)} task indexes left"
+    brackets = plugin.structure_index.indexes
+    assert not brackets, f"{len(brackets)} bracket indexes left"
+    occurrences = plugin.occurrence_indexes.indexes
+    assert not occurrences, f"{len(occurrences)} occurrence indexes left"
+    headings = plugin.outline_indexes.indexes
+    assert not headings, f"{len(headings)} heading indexes left"
+
+
+def check_headings(view):
+    check_line_index(plugin.outline_indexes.get(view), view)
+
+
+def check_upper(view):
+    for region in view.sel():
+        text = view.substr(region)
+        assert text == text.upper(), text
+
+
+CASES = {
+    "count_cold": (count_cold, check_count),
+    "count_edit": (count_edit, check_count),
+    "shrink_selection": (
+        command_case("shrink_selection", Corpus.line_regions),
+        None,
+    ),
+    "task_edit": (task_edit, check_tasks),
+    "close_view": (close_view, check_closed),
+    "heading_jump": (heading_jump, check_headings),
+    "expand_shrink": (expand_shrink, None),
+    "shrink_block": (shrink_block, None),
+    "structural_expand": (structural_expand, None),
+    "skip_forward": (
+        command_case("find_under_expand_skip_forward", Corpus.needle_regions),
+        None,
+    ),
+    "skip_held": (skip_held, None),
+    "skip_backward": (
+        command_case("find_under_expand_skip_backward", Corpus.needle_regions),
+        None,
+    ),
+    "add_remaining": (add_remaining, None),
+    "toggle_markdown_task": (
+        command_case("toggle_markdown_task", Corpus.line_starts),
+        None,
+    ),
+    "toggle_all": (toggle_all, None),
+    "project_tasks_cold": (project_tasks_case(warm=False), None),
+    "project_tasks_warm": (project_tasks_case(warm=True), None),
+    "uppercase_selection": (
+        command_case("uppercase_selection", Corpus.needle_regions),
+        check_upper,
+    ),
+    "lowercase_selection": (
+        command_case("lowercase_selection", Corpus.needle_regions),
+        None,
+    ),
+}
+
+
+def run_case(name, corpus, size_label, cursors, repeat, check):
+    setup, checker = CASES[name]
+    timings = []
+    placed = 0
+    for _ in range(repeat):
+        view, run = setup(corpus, cursors)
+        placed = len(view.sel())
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+        if check and checker is not None:
+            checker(view)
+        fake_sublime.run_timeouts()
+    return {
+        "case": name,
+        "size": size_label,
+        "bytes": len(corpus.text),
+        "cursors": cursors,
+        "cursors_placed": placed,
+        "runs": repeat,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+    }
+
+
+def compare(results, previous_path, threshold):
+    """Print new/old median ratios; returns the number of regressions"""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    old = {(r["case"], r["size"], r["cursors"]): r for r in previous["results"]}
+
+    regressions = 0
+    print(
+        f"\n{'case':<22} {'size':>6} {'cursors':>7} "
+        f"{'old s':>10} {'new s':>10} ratio"
+    )
+    for result in results:
+        key = (result["case"], result["size"], result["cursors"])
+        before = old.get(key)
+        if before is None:
+            continue
+        ratio = result["median_s"] / max(before["median_s"], 1e-9)
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  <-- slower"
+            regressions += 1
+        print(
+            f"{key[0]:<22} {key[1]:>6} {key[2]:>7} {before['median_s']:>10.4f} "
+            f"{result['median_s']:>10.4f} {ratio:5.2f}{flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1K,64K,1M,16M,100M")
+    parser.add_argument("--cursors", default="1,100,10000")
+    parser.add_argument("--only", help="comma-separated case names")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="1K-1M, <=100 cursors")
+    parser.add_argument("--check", action="store_true", help="verify results too")
+    parser.add_argument("--output", help="JSON file (default: results/<time>.json)")
+    parser.add_argument("--compare", help="earlier JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.sizes, args.cursors = "1K,64K,1M", "1,100"
+    sizes = args.sizes.split(",")
+    cursor_counts = [int(c) for c in args.cursors.split(",")]
+    names = args.only.split(",") if args.only else list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    results = []
+    print(f"{'case':<22} {'size':>6} {'cursors':>7} {'median s':>10} {'min s':>10}")
+    for size_label in sizes:
+        corpus = Corpus(parse_size(size_label))
+        for name in names:
+            for cursors in cursor_counts:
+                result = run_case(
+                    name, corpus, size_label, cursors, args.repeat, args.check
+                )
+                results.append(result)
+                print(
+                    f"{name:<22} {size_label:>6} {cursors:>7} "
+                    f"{result['median_s']:>10.4f} {result['min_s']:>10.4f}",
+                    flush=True,
+                )
+        if getattr(corpus, "folder", None) is not None:
+            shutil.rmtree(corpus.folder)
+
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(HERE, "results", f"{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1043 @@
+"""In-process stand-ins for the `sublime` and `sublime_plugin` modules.
+
+Only the parts of the API used by `User/_mcra_plugin_commands.py` are
+covered, close enough to the real thing to run the plugin headless:
+
+    import fake_sublime
+    fake_sublime.install()
+    import _mcra_plugin_commands as plugin
+
+Buffers are stored in chunks and selections are shifted lazily, so edits
+with thousands of cursors on a 100 MB buffer don't turn the fake itself
+into the bottleneck. Timers never fire on their own: call `run_timeouts()`
+to drain everything scheduled with `set_timeout`/`set_timeout_async`.
+"""
+
+import bisect
+import heapq
+import itertools
+import re
+import sys
+import types
+
+LITERAL = 1
+IGNORECASE = 2
+
+ENCODED_POSITION = 1
+HIDDEN = 1
+TRANSIENT = 4
+
+_ids = itertools.count(1)
+
+
+class Region:
+    __slots__ = ("a", "b", "xpos")
+
+    def __init__(self, a, b=None, xpos=-1):
+        if b is None:
+            b = a
+        self.a = a
+        self.b = b
+        self.xpos = xpos
+
+    def __iter__(self):
+        return iter((self.a, self.b))
+
+    def __len__(self):
+        return self.size()
+
+    def __eq__(self, other):
+        if isinstance(other, Region):
+            return self.a == other.a and self.b == other.b
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.a, self.b))
+
+    def __lt__(self, other):
+        return self.begin() < other.begin()
+
+    def __repr__(self):
+        return f"Region({self.a}, {self.b})"
+
+    def begin(self):
+        return self.a if self.a < self.b else self.b
+
+    def end(self):
+        return self.b if self.a < self.b else self.a
+
+    def size(self):
+        return abs(self.a - self.b)
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        return self.begin() <= x <= self.end()
+
+    def intersects(self, other):
+        return self.begin() < other.end() and other.begin() < self.end()
+
+    def cover(self, other):
+        return Region(
+            min(self.begin(), other.begin()), max(self.end(), other.end())
+        )
+
+
+class HistoricPosition:
+    """Position of a TextChange; row/col are only computed when asked for"""
+
+    __slots__ = ("pt", "change_count", "_view")
+
+    def __init__(self, view, pt, change_count):
+        self._view = view
+        self.pt = pt
+        self.change_count = change_count
+
+    @property
+    def row(self):
+        return self._view.rowcol(self.pt)[0]
+
+    @property
+    def col(self):
+        return self._view.rowcol(self.pt)[1]
+
+    row_utf16 = row
+    col_utf16 = col
+
+
+class TextChange:
+    __slots__ = ("a", "b", "len_utf16", "len_utf8", "str")
+
+    def __init__(self, a, b, text):
+        self.a = a
+        self.b = b
+        self.str = text
+        self.len_utf16 = len(text)
+        self.len_utf8 = len(text)
+
+
+class QuickPanelItem:
+    def __init__(self, trigger, details="", annotation="", kind=None):
+        self.trigger = trigger
+        self.details = details
+        self.annotation = annotation
+        self.kind = kind
+
+
+class Settings:
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def set(self, key, value):
+        self._values[key] = value
+
+    def has(self, key):
+        return key in self._values
+
+    def erase(self, key):
+        self._values.pop(key, None)
+
+
+class Selection:
+    """Sorted, merged regions with edits applied lazily
+
+    Region endpoints live in a flat sorted list. Edits are recorded as
+    range-adds in a Fenwick tree, so shifting the selections after each of
+    10k edits costs O(log^2 n) instead of touching every region.
+    """
+
+    def __init__(self, view):
+        self._view = view
+        self._regions = []
+        self._points = None  # Flat endpoints while edits are pending
+        self._reversed = None
+        self._tree = None
+        self._unsorted = False
+
+    # Lazy shifting -------------------------------------------------------------
+
+    def _begin_edits(self):
+        if self._points is not None:
+            return
+        self._normalize()
+        self._points = [p for r in self._regions for p in (r.begin(), r.end())]
+        self._reversed = [r.a > r.b for r in self._regions]
+        self._tree = [0] * (len(self._points) + 1)
+
+    def _add(self, index, delta):
+        tree = self._tree
+        index += 1
+        while index < len(tree):
+            tree[index] += delta
+            index += index & -index
+
+    def _value(self, index):
+        total = self._points[index]
+        tree = self._tree
+        index += 1
+        while index:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def _first_at_least(self, pt, strict=False):
+        lo, hi = 0, len(self._points)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self._value(mid)
+            if value > pt or (value == pt and not strict):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def _shift(self, begin, end, delta):
+        if not self._regions and self._points is None:
+            return
+        self._begin_edits()
+        inside = self._first_at_least(begin, strict=True)
+        after = self._first_at_least(end)
+        for index in range(inside, after):
+            # Endpoints inside the replaced text collapse onto its start
+            collapse = begin - self._value(index)
+            self._add(index, collapse)
+            if index + 1 < len(self._points):
+                self._add(index + 1, -collapse)
+        if after < len(self._points):
+            self._add(after, delta)
+
+    def _materialize(self):
+        self._apply_edits()
+        if self._unsorted:
+            self._normalize()
+
+    def _apply_edits(self):
+        if self._points is None:
+            return
+        points = [self._value(i) for i in range(len(self._points))]
+        regions = []
+        for index, reverse in enumerate(self._reversed):
+            begin, end = points[2 * index], points[2 * index + 1]
+            regions.append(Region(end, begin) if reverse else Region(begin, end))
+        self._points = self._reversed = self._tree = None
+        self._regions = regions
+        self._unsorted = True
+
+    # Public API --------------------------------------------------------------
+
+    def __iter__(self):
+        self._materialize()
+        return iter(list(self._regions))
+
+    def __len__(self):
+        self._materialize()
+        return len(self._regions)
+
+    def __getitem__(self, index):
+        self._materialize()
+        return self._regions[index]
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def clear(self):
+        self._points = self._reversed = self._tree = None
+        self._regions = []
+        self._unsorted = False
+
+    def add(self, region):
+        self._apply_edits()
+        if isinstance(region, int):
+            region = Region(region)
+        self._regions.append(Region(region.a, region.b))
+        self._unsorted = True
+
+    def add_all(self, regions):
+        self._apply_edits()
+        for region in regions:
+            if isinstance(region, int):
+                region = Region(region)
+            self._regions.append(Region(region.a, region.b))
+        self._unsorted = True
+
+    def contains(self, region):
+        self._materialize()
+        regions = self._regions
+        index = bisect.bisect_right(regions, Region(region.begin())) - 1
+        return index >= 0 and regions[index].contains(region)
+
+    def subtract(self, region):
+        self._materialize()
+        regions = self._regions
+        index = bisect.bisect_left(regions, Region(region.begin()))
+        while index < len(regions) and regions[index].begin() == region.begin():
+            if regions[index] == region:
+                del regions[index]
+                return
+            index += 1
+        self._regions = [r for r in regions if r != region]
+
+    def _normalize(self):
+        regions = sorted(self._regions, key=lambda r: (r.begin(), r.end()))
+        merged = []
+        for region in regions:
+            if merged:
+                last = merged[-1]
+                same_caret = region.empty() and region.begin() == last.end()
+                if region.begin() < last.end() or (
+                    same_caret and last.empty()
+                ):
+                    merged[-1] = last.cover(region)
+                    continue
+            merged.append(region)
+        self._regions = merged
+        self._unsorted = False
+
+
+class Buffer:
+    """Text stored as a list of chunks with lazy per-chunk newline counts"""
+
+    CHUNK = 64 * 1024
+
+    def __init__(self, text=""):
+        self._id = next(_ids)
+        self._views = []
+        self.change_listeners = []
+        self.pending_changes = []
+        self.change_count_value = 0
+        self._set_text(text)
+
+    def _set_text(self, text):
+        chunk = self.CHUNK
+        self.chunks = [text[i : i + chunk] for i in range(0, len(text), chunk)]
+        if not self.chunks:
+            self.chunks = [""]
+        self.lens = [len(c) for c in self.chunks]
+        self.newlines = [None] * len(self.chunks)  # Newline offsets per chunk
+        self.newline_counts = [c.count("\n") for c in self.chunks]
+        self.size = len(text)
+        self._starts = None
+        self._rows = None
+        self._flat = text
+
+    # Sublime API -------------------------------------------------------------
+
+    def id(self):
+        return self._id
+
+    def change_count(self):
+        return self.change_count_value
+
+    def views(self):
+        return [view for view in self._views if view.is_valid()]
+
+    def primary_view(self):
+        views = self.views()
+        return views[0] if views else None
+
+    def file_name(self):
+        view = self.primary_view()
+        return view.file_name() if view else None
+
+    # Storage -----------------------------------------------------------------
+
+    def starts(self):
+        if self._starts is None:
+            self._starts = list(itertools.accumulate(self.lens, initial=0))
+        return self._starts
+
+    def locate(self, pt):
+        """(chunk index, chunk start) of the chunk holding `pt`"""
+        starts = self.starts()
+        index = min(bisect.bisect_right(starts, pt) - 1, len(self.chunks) - 1)
+        return index, starts[index]
+
+    def text(self):
+        if self._flat is None:
+            self._flat = "".join(self.chunks)
+        return self._flat
+
+    def substr(self, begin, end):
+        begin = max(begin, 0)
+        end = min(end, self.size)
+        if begin >= end:
+            return ""
+        if self._flat is not None:
+            return self._flat[begin:end]
+        index, start = self.locate(begin)
+        parts = []
+        while begin < end:
+            chunk = self.chunks[index]
+            piece = chunk[begin - start : end - start]
+            parts.append(piece)
+            begin = start + len(chunk)
+            start = begin
+            index += 1
+        return "".join(parts)
+
+    def replace(self, begin, end, text):
+        first, first_start = self.locate(begin)
+        last, last_start = self.locate(end)
+        merged = (
+            self.chunks[first][: begin - first_start]
+            + text
+            + self.chunks[last][end - last_start :]
+        )
+        chunk = self.CHUNK
+        if len(merged) > 2 * chunk:
+            pieces = [merged[i : i + chunk] for i in range(0, len(merged), chunk)]
+        else:
+            pieces = [merged]
+        self.chunks[first : last + 1] = pieces
+        self.lens[first : last + 1] = [len(p) for p in pieces]
+        self.newlines[first : last + 1] = [None] * len(pieces)
+        self.newline_counts[first : last + 1] = [None] * len(pieces)
+        self.size += len(text) - (end - begin)
+        self._starts = None
+        self._rows = None
+        self._flat = None
+
+    def rfind_newline(self, pt):
+        """Offset of the last newline before `pt`, or -1"""
+        index, start = self.locate(pt)
+        pos = self.chunks[index].rfind("\n", 0, pt - start)
+        while pos == -1 and index > 0:
+            index -= 1
+            start -= self.lens[index]
+            pos = self.chunks[index].rfind("\n")
+        return start + pos if pos != -1 else -1
+
+    def find_newline(self, pt):
+        """Offset of the first newline at or after `pt`, or -1"""
+        index, start = self.locate(pt)
+        pos = self.chunks[index].find("\n", pt - start)
+        while pos == -1 and index + 1 < len(self.chunks):
+            start += self.lens[index]
+            index += 1
+            pos = self.chunks[index].find("\n")
+        return start + pos if pos != -1 else -1
+
+    def row(self, pt):
+        if self._rows is None:
+            counts = self.newline_counts
+            for index, count in enumerate(counts):
+                if count is None:
+                    counts[index] = self.chunks[index].count("\n")
+            self._rows = list(itertools.accumulate(counts, initial=0))
+        index, start = self.locate(pt)
+        return self._rows[index] + bisect.bisect_left(
+            self.chunk_newlines(index), pt - start
+        )
+
+    def chunk_newlines(self, index):
+        newlines = self.newlines[index]
+        if newlines is None:
+            chunk = self.chunks[index]
+            newlines = [m.start() for m in re.finditer("\n", chunk)]
+            self.newlines[index] = newlines
+        return newlines
+
+
+
+# What a closed view's buffer() gives: Buffer(0), with no views
+_NO_BUFFER = Buffer()
+_NO_BUFFER._id = 0
+
+class Edit:
+    def __init__(self, view):
+        self.view = view
+
+
+class View:
+    def __init__(self, window=None, text="", file_name=None, syntax=None):
+        self._id = next(_ids)
+        self._buffer = Buffer(text)
+        self._buffer._views.append(self)
+        self._window = window
+        self._file_name = file_name
+        self._status = {}
+        self._settings = Settings()
+        self._sel = Selection(self)
+        self._name = ""
+        self._scratch = False
+        self._valid = True
+        self._visible = None
+        self._syntax = syntax
+        if syntax is None and file_name and file_name.endswith(".md"):
+            self._syntax = "text.html.markdown"
+        self.shown = []
+        _attach_change_listeners(self._buffer)
+
+    # Identity ----------------------------------------------------------------
+
+    def id(self):
+        return self._id
+
+    def buffer_id(self):
+        # Like Sublime, a closed view no longer knows its buffer
+        return self._buffer.id() if self._valid else 0
+
+    def buffer(self):
+        return self._buffer if self._valid else _NO_BUFFER
+
+    def window(self):
+        return self._window
+
+    def is_valid(self):
+        return self._valid
+
+    def is_loading(self):
+        return False
+
+    def is_scratch(self):
+        return self._scratch
+
+    def file_name(self):
+        return self._file_name
+
+    def name(self):
+        return self._name
+
+    def set_name(self, name):
+        self._name = name
+
+    def set_scratch(self, scratch):
+        self._scratch = scratch
+
+    def set_read_only(self, read_only):
+        pass
+
+    def settings(self):
+        return self._settings
+
+    def element(self):
+        return None
+
+    def match_selector(self, pt, selector):
+        return bool(self._syntax) and selector in self._syntax
+
+    def assign_syntax(self, syntax):
+        self._syntax = syntax
+
+    # Text --------------------------------------------------------------------
+
+    def size(self):
+        return self._buffer.size
+
+    def change_count(self):
+        return self._buffer.change_count_value
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self._buffer.substr(x.begin(), x.end())
+        if 0 <= x < self._buffer.size:
+            return self._buffer.substr(x, x + 1)
+        return "\0"
+
+    def sel(self):
+        return self._sel
+
+    def _line_bounds(self, pt):
+        buf = self._buffer
+        start = buf.rfind_newline(pt) + 1
+        end = buf.find_newline(pt)
+        if end == -1:
+            end = buf.size
+        return start, end
+
+    def line(self, x):
+        if isinstance(x, Region):
+            start, _ = self._line_bounds(x.begin())
+            _, end = self._line_bounds(x.end())
+            return Region(start, end)
+        return Region(*self._line_bounds(x))
+
+    def full_line(self, x):
+        region = self.line(x)
+        end = region.end()
+        if end < self.size():
+            end += 1
+        return Region(region.begin(), end)
+
+    def lines(self, region):
+        result = []
+        pt = region.begin()
+        while True:
+            line = self.line(pt)
+            result.append(line)
+            if line.end() >= region.end() or line.end() >= self.size():
+                break
+            pt = line.end() + 1
+        return result
+
+    def rowcol(self, pt):
+        buf = self._buffer
+        pt = max(0, min(pt, buf.size))
+        return buf.row(pt), pt - (buf.rfind_newline(pt) + 1)
+
+    def text_point(self, row, col):
+        pos = 0
+        for _ in range(row):
+            nl = self._buffer.find_newline(pos)
+            if nl == -1:
+                return self.size()
+            pos = nl + 1
+        return min(pos + col, self.size())
+
+    def classify(self, pt):
+        return 0
+
+    def word(self, x):
+        pt = x.begin() if isinstance(x, Region) else x
+        text = self._buffer.text()
+        start = pt
+        while start > 0 and (text[start - 1].isalnum() or text[start - 1] == "_"):
+            start -= 1
+        end = pt
+        while end < len(text) and (text[end].isalnum() or text[end] == "_"):
+            end += 1
+        return Region(start, end)
+
+    @staticmethod
+    def _compile(pattern, flags):
+        if flags & LITERAL:
+            pattern = re.escape(pattern)
+        re_flags = re.IGNORECASE if flags & IGNORECASE else 0
+        return re.compile(pattern, re_flags | re.MULTILINE)
+
+    def find(self, pattern, start_pt, flags=0):
+        regex = self._compile(pattern, flags)
+        match = regex.search(self._buffer.text(), max(start_pt, 0))
+        if not match:
+            return Region(-1, -1)
+        return Region(match.start(), match.end())
+
+    def find_all(self, pattern, flags=0, fmt=None, extractions=None):
+        regex = self._compile(pattern, flags)
+        return [
+            Region(m.start(), m.end()) for m in regex.finditer(self._buffer.text())
+        ]
+
+    def _apply(self, begin, end, text):
+        buf = self._buffer
+        count = buf.change_count_value
+        buf.replace(begin, end, text)
+        buf.change_count_value += 1
+        delta = len(text) - (end - begin)
+        for view in buf.views():
+            view._sel._shift(begin, end, delta)
+        buf.pending_changes.append(
+            TextChange(
+                HistoricPosition(self, begin, count),
+                HistoricPosition(self, end, count),
+                text,
+            )
+        )
+
+    def _flush_changes(self):
+        buf = self._buffer
+        changes = buf.pending_changes
+        buf.pending_changes = []
+        if changes:
+            for listener in buf.change_listeners:
+                listener.on_text_changed(changes)
+            for view in buf.views():
+                _dispatch("on_modified", view)
+
+    def insert(self, edit, pt, text):
+        self._apply(pt, pt, text)
+        if edit is None:
+            self._flush_changes()
+        return len(text)
+
+    def replace(self, edit, region, text):
+        self._apply(region.begin(), region.end(), text)
+        if edit is None:
+            self._flush_changes()
+
+    def erase(self, edit, region):
+        self._apply(region.begin(), region.end(), "")
+        if edit is None:
+            self._flush_changes()
+
+    # Presentation ------------------------------------------------------------
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def get_status(self, key):
+        return self._status.get(key, "")
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    def show(self, x, show_surrounds=True, keep_to_left=False, animate=True):
+        self.shown.append(x)
+
+    def show_at_center(self, x, animate=True):
+        self.shown.append(x)
+
+    def visible_region(self):
+        if self._visible is not None:
+            return self._visible
+        return Region(0, min(self.size(), 4000))
+
+    def viewport_position(self):
+        return (0.0, 0.0)
+
+    def viewport_extent(self):
+        return (800.0, 600.0)
+
+    def set_viewport_position(self, xy, animate=True):
+        pass
+
+    def text_to_layout(self, pt):
+        return (0.0, float(self.rowcol(pt)[0]) * 20.0)
+
+    def run_command(self, name, args=None):
+        if name == "append":
+            self._apply(self.size(), self.size(), (args or {})["characters"])
+            self._flush_changes()
+            return
+        if name == "expand_selection":
+            # Built-in stand-in: grow every region to its full line
+            _dispatch("on_text_command", self, name, args)
+            regions = [self.line(region) for region in self.sel()]
+            self.sel().clear()
+            self.sel().add_all(regions)
+            _dispatch("on_selection_modified", self)
+            return
+        cls = _text_commands().get(name)
+        if cls is None:
+            raise KeyError(name)
+        command = cls(self)
+        _dispatch("on_text_command", self, name, args)
+        command.run(Edit(self), **(args or {}))
+        self._flush_changes()
+        _dispatch("on_selection_modified", self)
+
+    def close(self):
+        _dispatch("on_pre_close", self)
+        self._valid = False
+        if self._window is not None:
+            self._window._views.remove(self)
+            if self._window._active is self:
+                views = self._window._views
+                self._window._active = views[-1] if views else None
+        _dispatch("on_close", self)
+
+
+class Window:
+    def __init__(self):
+        self._id = next(_ids)
+        self._views = []
+        self._active = None
+        self._folders = []
+        self.quick_panels = []
+        self._panels = {}
+
+    def id(self):
+        return self._id
+
+    def is_valid(self):
+        return True
+
+    def views(self):
+        return list(self._views)
+
+    def active_view(self):
+        return self._active
+
+    def num_groups(self):
+        return 1
+
+    def active_group(self):
+        return 0
+
+    def active_view_in_group(self, group):
+        return self._active
+
+    def focus_view(self, view):
+        self._active = view
+        _dispatch("on_activated", view)
+
+    def folders(self):
+        return list(self._folders)
+
+    def set_folders(self, folders):
+        self._folders = list(folders)
+
+    def open_view(self, text="", file_name=None, syntax=None):
+        view = View(self, text, file_name, syntax)
+        self._views.append(view)
+        self._active = view
+        return view
+
+    def new_file(self, flags=0, syntax=""):
+        return self.open_view()
+
+    def open_file(self, file_name, flags=0, group=-1):
+        path = file_name.split(":")[0]
+        for view in self._views:
+            if view.file_name() == path:
+                self._active = view
+                return view
+        with open(path, encoding="utf-8") as f:
+            return self.open_view(f.read(), path)
+
+    def create_output_panel(self, name, unlisted=False):
+        panel = self._panels.get(name)
+        if panel is None:
+            panel = View(self)
+            self._panels[name] = panel
+        return panel
+
+    def find_output_panel(self, name):
+        return self._panels.get(name)
+
+    def run_command(self, name, args=None):
+        cls = _window_commands().get(name)
+        if cls is None:
+            return
+        cls(self).run(**(args or {}))
+
+    def show_quick_panel(
+        self,
+        items,
+        on_select,
+        flags=0,
+        selected_index=-1,
+        on_highlight=None,
+        placeholder=None,
+    ):
+        self.quick_panels.append((items, on_select))
+
+
+_windows = []
+_settings = {}
+_timeouts = []
+_clock = [0]
+_sequence = itertools.count()
+status_messages = []
+
+
+def windows():
+    return list(_windows)
+
+
+def active_window():
+    if not _windows:
+        _windows.append(Window())
+    return _windows[0]
+
+
+def new_window():
+    window = Window()
+    _windows.append(window)
+    return window
+
+
+def load_settings(name):
+    return _settings.setdefault(name, Settings())
+
+
+def save_settings(name):
+    pass
+
+
+def status_message(message):
+    status_messages.append(message)
+
+
+def message_dialog(message):
+    status_messages.append(message)
+
+
+def error_message(message):
+    status_messages.append(message)
+
+
+def set_clipboard(text):
+    pass
+
+
+def packages_path():
+    return "/tmp"
+
+
+def cache_path():
+    return "/tmp"
+
+
+def set_timeout(callback, delay=0):
+    heapq.heappush(_timeouts, (_clock[0] + delay, next(_sequence), callback))
+
+
+set_timeout_async = set_timeout
+
+
+def run_timeouts(limit=100000, advance=None):
+    """Run scheduled callbacks in time order, at most `limit` of them
+
+    With `advance`, only callbacks due within that many milliseconds from
+    now run, and the clock ends exactly `advance` ms later.
+    """
+    deadline = None if advance is None else _clock[0] + advance
+    ran = 0
+    while _timeouts and ran < limit:
+        due, _, callback = _timeouts[0]
+        if deadline is not None and due > deadline:
+            break
+        heapq.heappop(_timeouts)
+        _clock[0] = max(_clock[0], due)
+        callback()
+        ran += 1
+    if deadline is not None:
+        _clock[0] = deadline
+    return ran
+
+
+def pending_timeouts():
+    return len(_timeouts)
+
+
+def reset():
+    """Forget all windows, settings and timers"""
+    _windows.clear()
+    _settings.clear()
+    _timeouts.clear()
+    status_messages.clear()
+    _clock[0] = 0
+
+
+# sublime_plugin ---------------------------------------------------------------
+
+_event_listener_classes = []
+_event_listeners = []
+_change_listener_classes = []
+_command_classes = []
+
+
+def _snake_name(cls):
+    name = cls.__name__
+    if name.endswith("Command"):
+        name = name[: -len("Command")]
+    return re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", name).lower()
+
+
+def _commands(base):
+    return {_snake_name(c): c for c in _command_classes if issubclass(c, base)}
+
+
+def _text_commands():
+    return _commands(TextCommand)
+
+
+def _window_commands():
+    return _commands(WindowCommand)
+
+
+def _dispatch(event, view, *args):
+    for listener in _event_listener_instances():
+        for name in (event, event + "_async"):
+            handler = getattr(listener, name, None)
+            if handler is not None:
+                handler(view, *args)
+
+
+def _event_listener_instances():
+    known = {type(listener) for listener in _event_listeners}
+    for cls in _event_listener_classes:
+        if cls not in known:
+            _event_listeners.append(cls())
+    return list(_event_listeners)
+
+
+def _attach_change_listeners(buffer):
+    for cls in _change_listener_classes:
+        if cls.is_applicable(buffer):
+            listener = cls()
+            listener.buffer = buffer
+            buffer.change_listeners.append(listener)
+
+
+class EventListener:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _event_listener_classes.append(cls)
+
+
+class TextChangeListener:
+    buffer = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _change_listener_classes.append(cls)
+
+    @classmethod
+    def is_applicable(cls, buffer):
+        return True
+
+    def is_attached(self):
+        return self.buffer is not None
+
+
+class TextCommand:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _command_classes.append(cls)
+
+    def __init__(self, view):
+        self.view = view
+
+    def is_enabled(self):
+        return True
+
+
+class WindowCommand:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _command_classes.append(cls)
+
+    def __init__(self, window):
+        self.window = window
+
+
+class ApplicationCommand:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _command_classes.append(cls)
+
+
+def run_command(name, args=None):
+    cls = _commands(ApplicationCommand).get(name)
+    if cls is not None:
+        cls().run(**(args or {}))
+
+
+def dispatch(event, view, *args):
+    """Fire an EventListener hook the way Sublime would"""
+    _dispatch(event, view, *args)
+
+
+def install():
+    """Register the fakes as `sublime` and `sublime_plugin`"""
+    this = sys.modules[__name__]
+    plugin = types.ModuleType("sublime_plugin")
+    for name in (
+        "EventListener",
+        "TextChangeListener",
+        "TextCommand",
+        "WindowCommand",
+        "ApplicationCommand",
+    ):
+        setattr(plugin, name, globals()[name])
+    sys.modules["sublime"] = this
+    sys.modules["sublime_plugin"] = plugin
+    return this, plugin
@@ -0,0 +1,101 @@
+"""Throughput of the ANSI cleaner engines.
+
+    python3 bench_clean_ansi.py             # 4, 8 and 16 MiB inputs
+    python3 bench_clean_ansi.py --size 64 --engine state
+
+Each engine cleans each corpus at the size and twice and four times it. The
+MB/s column is for the largest input, and `x4` is how much longer that took
+than the smallest: about 4 means time grows linearly with the input.
+"""
+
+import argparse
+import sys
+import time
+
+from clean_ansi_escape_sequences import ENGINES
+
+MIB = 1 << 20
+
+
+def repeat_to(unit, size):
+    return (unit * (size // len(unit) + 1))[:size]
+
+
+# Corpora, each a function of the size in bytes ----
+
+def plain(size):
+    line = b"2025-08-15 14:33:22 INFO  compiling src/module/file_42.c -O2 -Wall\n"
+    return repeat_to(line, size)
+
+
+def colour(size):
+    # Test runner output: a few SGR sequences on every line
+    line = (
+        b"\x1b[1m\x1b[32mPASSED\x1b[0m tests/test_parser.py::test_case_17 "
+        b"\x1b[2m(0.03s)\x1b[0m \x1b[33m[ 42%]\x1b[0m\n"
+    )
+    return repeat_to(line, size)
+
+
+def progress(size):
+    # A progress bar redrawn in place, no newlines
+    frames = b"".join(
+        b"\r\x1b[2K\x1b[?25l%3d%% |%s%s| %d/1000 \x1b]0;%d%%\x07"
+        % (i // 10, b"#" * (i // 40), b" " * (25 - i // 40), i, i // 10)
+        for i in range(1000)
+    )
+    return repeat_to(frames, size)
+
+
+def osc(size):
+    # An OSC 8 hyperlink whose terminator never comes
+    return repeat_to(b"\x1b]8;;", 6) + repeat_to(b"https://example.com/a", size - 6)
+
+
+def csi(size):
+    # A CSI that never gets its final byte, then one more
+    return b"\x1b[" + repeat_to(b"0;", size - 3) + b"\x1b"
+
+
+CORPORA = {
+    "plain": plain,
+    "colour": colour,
+    "progress": progress,
+    "osc": osc,
+    "csi": csi,
+}
+
+
+def best_time(subn, data, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subn(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=4, help="smallest input, MiB")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument("--engine", choices=ENGINES, action="append")
+    parser.add_argument("--corpus", choices=CORPORA, action="append")
+    args = parser.parse_args()
+
+    engines = args.engine or list(ENGINES)
+    corpora = args.corpus or list(CORPORA)
+    sizes = [args.size * MIB * factor for factor in (1, 2, 4)]
+
+    print(f"{'corpus':<10} {'engine':<8} {'MB/s':>8} {'x4':>6}")
+    for corpus in corpora:
+        inputs = [CORPORA[corpus](size) for size in sizes]
+        for engine in engines:
+            times = [best_time(ENGINES[engine], data, args.repeat) for data in inputs]
+            rate = sizes[-1] / times[-1] / 1e6
+            print(f"{corpus:<10} {engine:<8} {rate:>8.1f} {times[-1] / times[0]:>6.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
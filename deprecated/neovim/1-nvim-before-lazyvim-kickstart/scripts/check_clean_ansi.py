@@ -0,0 +1,142 @@
+"""Differential check of the ANSI cleaner engines.
+
+    python3 check_clean_ansi.py                 # 20000 cases
+    python3 check_clean_ansi.py --cases 200000 --seed 7
+
+Generates inputs that are dense in ESC, CSI, OSC and terminator bytes and
+checks that the state machine engine gives the same output and count as the
+regex, and that streaming with each engine, at random chunk sizes and with
+tiny spill sizes, gives the same output as cleaning all at once. Exits 1 on
+the first difference, printing the (shrunk) input. Last, the script itself
+cleans a pipe passed as /dev/stdin, streaming and with --one-shot.
+"""
+
+import argparse
+import io
+import os
+import random
+import subprocess
+import sys
+
+from clean_ansi_escape_sequences import ENGINES, StreamCleaner, regex_subn
+
+SCRIPT = os.path.join(os.path.dirname(__file__), "clean_ansi_escape_sequences.py")
+
+# Bytes that steer the parser, plus some plain ones
+ALPHABET = [
+    b"\x1b", b"\x1b", b"\x1b", b"[", b"]", b"\x07", b"\\", b"1", b";", b"?",
+    b" ", b"!", b"m", b"K", b"A", b"~", b"-", b"_", b"\n", b"\r", b"x", b"\xff",
+]
+
+# Well-formed and almost well-formed pieces
+FRAGMENTS = [
+    b"\x1b[0m", b"\x1b[1;31m", b"\x1b[2K\r", b"\x1b[?25l", b"\x1b[ q",
+    b"\x1b]0;title\x07", b"\x1b]8;;https://example.com\x1b\\", b"\x1b]2;no end",
+    b"\x1b[12;", b"\x1b]", b"\x1b", b"\x1bM", b"\x1b(B", b"plain text ",
+]
+
+
+def generate(rnd):
+    size = rnd.choice([0, 1, 2, 5, 20, 80, 400])
+    parts = []
+    for _ in range(size):
+        if rnd.random() < 0.3:
+            parts.append(rnd.choice(FRAGMENTS))
+        else:
+            parts.append(rnd.choice(ALPHABET))
+    return b"".join(parts)
+
+
+def stream(data, subn, chunk_size, spill_size):
+    out = io.BytesIO()
+    cleaner = StreamCleaner(out.write, spill_size, subn)
+    for start in range(0, len(data), chunk_size):
+        cleaner.feed(data[start : start + chunk_size])
+    cleaner.close()
+    return out.getvalue(), cleaner.removed
+
+
+def differences(data, rnd):
+    """Descriptions of where the engines and modes disagree on `data`"""
+    want = regex_subn(data)
+    found = []
+    for name, subn in ENGINES.items():
+        got = subn(data)
+        if got != want:
+            found.append(f"{name}: {got!r} != {want!r}")
+        chunk_size = rnd.randint(1, 16)
+        spill_size = rnd.randint(1, 8)
+        got = stream(data, subn, chunk_size, spill_size)
+        if got != want:
+            found.append(
+                f"{name} streamed by {chunk_size} (spill {spill_size}): "
+                f"{got!r} != {want!r}"
+            )
+    return found
+
+
+def pipe_differences(data):
+    """Descriptions of where cleaning `data` from a pipe goes wrong"""
+    want = regex_subn(data)[0]
+    found = []
+    for extra in ([], ["--one-shot"]):
+        command = [sys.executable, SCRIPT, "--chunk-size", "7", *extra, "/dev/stdin"]
+        result = subprocess.run(command, input=data, capture_output=True)
+        if result.returncode or result.stdout != want:
+            found.append(
+                f"{' '.join(command[2:])}: exit {result.returncode}, "
+                f"{result.stdout!r} != {want!r} {result.stderr.decode()}"
+            )
+    return found
+
+
+def shrink(data, fails):
+    """A shorter input that still `fails`, dropping one byte at a time"""
+    i = 0
+    while i < len(data):
+        shorter = data[:i] + data[i + 1 :]
+        if fails(shorter):
+            data = shorter
+        else:
+            i += 1
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    for case in range(args.cases):
+        data = generate(rnd)
+        state = rnd.getstate()
+        if not differences(data, rnd):
+            continue
+
+        def fails(candidate):
+            rnd.setstate(state)
+            return bool(differences(candidate, rnd))
+
+        data = shrink(data, fails)
+        rnd.setstate(state)
+        print(f"case {case}: {data!r}")
+        for difference in differences(data, rnd):
+            print(f"  {difference}")
+        return 1
+
+    print(f"{args.cases} cases, engines and streaming agree")
+
+    data = b"".join(generate(rnd) for _ in range(100))
+    found = pipe_differences(data)
+    for difference in found:
+        print(f"pipe: {difference}")
+    if found:
+        return 1
+    print(f"{len(data)} bytes cleaned from a pipe")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,47 @@
+"""Strip ANSI escape sequences from stdin or files.
+
+    some-command | python3 clean_ansi_escape_sequences.py > clean.log
+    python3 clean_ansi_escape_sequences.py build-*.log > clean.log
+    python3 clean_ansi_escape_sequences.py -o clean/ 'logs/**/*.log'
+    python3 clean_ansi_escape_sequences.py --in-place 'logs/**/*.log'
+
+Input is cleaned as bytes, a chunk at a time (--chunk-size), holding back
+only a trailing escape sequence that more input could still complete, so
+memory stays bounded and the output is the same as with --one-shot, which
+reads everything first. Regular files are memory-mapped, and chunks
+without an ESC are written out as they are; pipes and the like are read.
+
+With --output-dir or --in-place, files are cleaned by a process pool, large
+ones split at newlines no sequence spans, and each result replaces its
+target atomically. A summary of bytes in/out and sequences removed per file
+is printed.
+
+--engine picks how sequences are found: the `ansi_escape` regex, or
+`state_subn`, an explicit state machine for the same grammar. See
+bench_clean_ansi.py and check_clean_ansi.py next to this script.
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import mmap
+import os
 import re
+import shutil
+import stat
 import sys
+import tempfile
 
-input_text = sys.stdin.read()
+ESC = b"\x1b"
 
-if not input_text:
-    print("No input provided")
-    sys.exit(1)
+# Bytes read at a time in streaming mode
+CHUNK_SIZE = 1 << 20
+
+# Files are cleaned in parallel pieces of about this size
+SPLIT_SIZE = 64 << 20
 
 ansi_escape = re.compile(
-    r"""
+    rb"""
     \x1B                        # ESC
     (?:                         # Start non-capturing group for the rest
         [@-Z\-_]                # 7-bit C1 control codes
@@ -24,6 +57,490 @@ ansi_escape = re.compile(
     re.VERBOSE,
 )
 
-cleaned_text = ansi_escape.sub("", input_text)
-sys.stdout.write(cleaned_text)
-sys.exit(0)
+# ECMA-48 parser states of state_subn(), the ground state is its outer loop
+ESCAPE, CSI_PARAM, CSI_INTERMEDIATE, OSC_STRING, OSC_ESCAPE = range(5)
+
+
+def regex_subn(data):
+    return ansi_escape.subn(b"", data)
+
+
+def state_subn(data):
+    """ansi_escape.subn(b"", data) as an explicit ECMA-48 state machine
+
+    It accepts exactly what ansi_escape does, an OSC ended by a lone ESC
+    included, so the engines are interchangeable. Plain text and OSC
+    payloads are skipped with find(), and the next BEL is remembered, so no
+    byte is looked at more than a few times whatever the input.
+    """
+    end = len(data)
+    pieces = []
+    removed = 0
+    kept = 0  # Start of the text not in `pieces` yet
+    next_bel = -1
+    start = data.find(ESC)
+    while start >= 0:
+        state = ESCAPE
+        stop = -1  # End of the sequence at `start`, -1 if there's none
+        i = start + 1
+        while i < end:
+            byte = data[i]
+            if state == ESCAPE:
+                if byte == 0x5B:  # [
+                    state = CSI_PARAM
+                elif byte == 0x5D:  # ]
+                    state = OSC_STRING
+                elif 0x40 <= byte <= 0x5A or byte == 0x2D or byte == 0x5F:
+                    stop = i + 1
+                    break
+                else:
+                    break
+            elif state == CSI_PARAM or state == CSI_INTERMEDIATE:
+                if 0x40 <= byte <= 0x7E:
+                    stop = i + 1
+                    break
+                if 0x20 <= byte <= 0x2F:
+                    state = CSI_INTERMEDIATE
+                elif state == CSI_INTERMEDIATE or not 0x30 <= byte <= 0x3F:
+                    break
+            elif state == OSC_STRING:
+                # The payload runs up to the next ESC or BEL
+                if next_bel < i:
+                    next_bel = data.find(b"\x07", i)
+                    if next_bel < 0:
+                        next_bel = end
+                next_esc = data.find(ESC, i, next_bel)
+                if next_esc < 0:
+                    if next_bel < end:
+                        stop = next_bel + 1
+                    break
+                state = OSC_ESCAPE
+                i = next_esc
+            else:  # OSC_ESCAPE: ESC\ or a lone ESC
+                stop = i + 1 if byte == 0x5C else i
+                break
+            i += 1
+        else:
+            # Out of input, only an OSC ended by a lone ESC is complete
+            if state == OSC_ESCAPE:
+                stop = end
+
+        if stop < 0:
+            start = data.find(ESC, start + 1)
+        else:
+            pieces.append(data[kept:start])
+            kept = stop
+            removed += 1
+            start = data.find(ESC, stop)
+    pieces.append(data[kept:])
+    return b"".join(pieces), removed
+
+
+ENGINES = {"regex": regex_subn, "state": state_subn}
+
+# A sequence start that more input could still turn into a match: a lone
+# ESC, a CSI without its final byte or an OSC without its terminator
+incomplete_escape = re.compile(rb"\x1B(?:\[[0-?]*[ -/]*|\][^\x1B\x07]*)?")
+
+
+def settled_end(text, start=0, end=None):
+    """End of the part of text[start:end] that more input can't clean
+    differently, given that no sequence spans `start`
+
+    Everything up to the last ESC is settled, as no sequence contains an
+    ESC other than an OSC's terminator. Whether that last ESC starts a
+    sequence or ends an OSC depends on the chain of `ESC ]` openers before
+    it: in such a chain every other ESC is a terminator.
+    """
+    if end is None:
+        end = len(text)
+    last = text.rfind(ESC, start, end)
+    if last < 0:
+        return end
+
+    chain = [last]
+    while True:
+        before = text.rfind(ESC, start, chain[-1])
+        if before < 0 or text[before + 1 : before + 2] != b"]":
+            break
+        if text.find(b"\x07", before, chain[-1]) >= 0:
+            break
+        chain.append(before)
+
+    if len(chain) % 2:
+        # The last ESC starts a sequence, hold it back if it may go on
+        if incomplete_escape.fullmatch(text, last, end):
+            return last
+        return end
+    # The last ESC ends the OSC before it, unless it turns out to be ESC\
+    if last == end - 1:
+        return chain[1]
+    return end
+
+
+def compact(carry):
+    """A short stand-in for an undecided `carry` that cleans the same way
+
+    The payload of an OSC or the parameters of a CSI can't change how it
+    ends, only whether it's kept (verbatim) or dropped.
+    """
+    if carry[1:2] == b"]":
+        return b"\x1b]\x1b" if carry.endswith(ESC) and len(carry) > 2 else b"\x1b]"
+    if carry[1:2] == b"[":
+        intermediate = carry[-1:] if b" " <= carry[-1:] <= b"/" else b""
+        return b"\x1b[" + intermediate
+    return carry
+
+
+class StreamCleaner:
+    """Cleans bytes fed in chunks into `write`, exactly like ansi_escape.sub
+    over all of it
+
+    The undecided tail (`carry`) starts with an ESC. Once it outgrows
+    `spill_size` it goes to a temporary file and only a compact stand-in
+    is matched against, so an unterminated OSC can't hold the input in
+    memory. `bytes_out` and `removed` (sequences) add up what was written.
+    """
+
+    def __init__(self, write, spill_size=CHUNK_SIZE, subn=regex_subn):
+        self.write = write
+        self.subn = subn
+        self.carry = b""
+        self.spill = None
+        self.spill_size = spill_size
+        self.bytes_out = 0
+        self.removed = 0
+
+    def emit(self, data):
+        self.bytes_out += len(data)
+        self.write(data)
+
+    def emit_cleaned(self, text):
+        cleaned, removed = self.subn(text)
+        self.removed += removed
+        self.emit(cleaned)
+
+    def feed(self, chunk):
+        if not self.carry and chunk.find(ESC) < 0:
+            self.emit(chunk)
+            return
+        text = self.carry + chunk
+        end = settled_end(text)
+
+        if end == 0:
+            # Still undecided, remember it
+            if self.spill is not None:
+                self.spill.write(chunk)
+                self.carry = compact(text)
+            elif len(text) > self.spill_size:
+                self.spill = tempfile.SpooledTemporaryFile(self.spill_size)
+                self.spill.write(text)
+                self.carry = compact(text)
+            else:
+                self.carry = text
+            return
+
+        if self.spill is not None and not ansi_escape.match(text):
+            # The spilled sequence never matched: it's kept as it was
+            self.flush_spill()
+            self.emit_cleaned(text[len(self.carry) : end])
+        else:
+            self.discard_spill()
+            self.emit_cleaned(text[:end])
+        self.carry = text[end:]
+
+    def close(self):
+        """Clean what's left at the end of the input"""
+        if self.spill is None:
+            self.emit_cleaned(self.carry)
+        elif ansi_escape.match(self.carry):
+            self.removed += 1
+            self.discard_spill()
+        else:
+            self.flush_spill()
+        self.carry = b""
+
+    def flush_spill(self):
+        self.spill.seek(0)
+        while True:
+            text = self.spill.read(self.spill_size)
+            if not text:
+                break
+            self.emit(text)
+        self.discard_spill()
+
+    def discard_spill(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+
+def clean_stream(
+    source, sink, chunk_size=CHUNK_SIZE, one_shot=False, subn=regex_subn
+):
+    """Clean the binary file object `source` into `sink`
+
+    Returns bytes in, bytes out and the number of sequences removed.
+    """
+    if one_shot:
+        data = source.read()
+        cleaned, removed = subn(data)
+        sink.write(cleaned)
+        return len(data), len(cleaned), removed
+    cleaner = StreamCleaner(sink.write, chunk_size, subn)
+    bytes_in = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        bytes_in += len(chunk)
+        cleaner.feed(chunk)
+    cleaner.close()
+    return bytes_in, cleaner.bytes_out, cleaner.removed
+
+
+def clean_file(
+    path,
+    sink,
+    chunk_size=CHUNK_SIZE,
+    one_shot=False,
+    start=0,
+    end=None,
+    subn=regex_subn,
+):
+    """Clean bytes start:end of the file at `path` into `sink`
+
+    A regular file is memory-mapped, and chunks without an ESC are written
+    out as memoryview slices of the mapping, without copying them. Anything
+    else (a pipe, /dev/stdin) can't be mapped and is streamed whole, as
+    split_ranges never splits it. Returns bytes in, bytes out and the
+    number of sequences removed.
+    """
+    with open(path, "rb") as f:
+        if not stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+            return clean_stream(f, sink, chunk_size, one_shot, subn)
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty files can't be mapped
+            return 0, 0, 0
+    with data, memoryview(data) as view:
+        if end is None:
+            end = len(data)
+        if one_shot:
+            whole = start == 0 and end == len(data)
+            cleaned, removed = subn(data if whole else data[start:end])
+            sink.write(cleaned)
+            return end - start, len(cleaned), removed
+        cleaner = StreamCleaner(sink.write, chunk_size, subn)
+        for chunk_start in range(start, end, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, end)
+            if not cleaner.carry and data.find(ESC, chunk_start, chunk_end) < 0:
+                cleaner.emit(view[chunk_start:chunk_end])
+            else:
+                cleaner.feed(data[chunk_start:chunk_end])
+        cleaner.close()
+    return end - start, cleaner.bytes_out, cleaner.removed
+
+
+def clean_part(path, start, end, part_path, chunk_size, subn):
+    """Clean bytes start:end of `path` into the file `part_path` (in a worker)"""
+    with open(part_path, "wb") as out:
+        return clean_file(path, out, chunk_size, start=start, end=end, subn=subn)
+
+
+def split_ranges(path, split_size):
+    """(start, end) pieces of about `split_size` of the file at `path`, that
+    can be cleaned on their own
+
+    Pieces end at a newline that no escape sequence spans: one that isn't
+    inside an OSC, the only sequence a newline can be part of.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= split_size:
+            return [(0, size)]
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    ranges = []
+    start = 0
+    with data:
+        while size - start > split_size:
+            newline = data.find(b"\n", start + split_size)
+            while newline >= 0 and settled_end(data, start, newline + 1) <= newline:
+                # Inside an OSC, the next candidate is past its terminator
+                ends = [data.find(ESC, newline), data.find(b"\x07", newline)]
+                ends = [end for end in ends if end >= 0]
+                newline = data.find(b"\n", min(ends)) if ends else -1
+            if newline < 0:
+                break
+            ranges.append((start, newline + 1))
+            start = newline + 1
+    ranges.append((start, size))
+    return ranges
+
+
+def expand_paths(patterns):
+    """Files named by `patterns`, which may be globs (** included)"""
+    paths = []
+    for pattern in patterns:
+        if not glob.has_magic(pattern):
+            paths.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern, recursive=True))
+        files = [path for path in matches if os.path.isfile(path)]
+        if not files:
+            raise SystemExit(f"No files match {pattern}")
+        paths.extend(files)
+    return list(dict.fromkeys(paths))
+
+
+def output_paths(paths, output_dir):
+    """Where each of `paths` is written: itself in place, or the same path
+    under `output_dir` relative to the inputs' common directory"""
+    if output_dir is None:
+        return paths
+    absolute = [os.path.abspath(path) for path in paths]
+    common = os.path.commonpath([os.path.dirname(path) for path in absolute])
+    return [
+        os.path.join(output_dir, os.path.relpath(path, common)) for path in absolute
+    ]
+
+
+def clean_files(
+    paths,
+    targets,
+    jobs,
+    chunk_size=CHUNK_SIZE,
+    split_size=SPLIT_SIZE,
+    subn=regex_subn,
+):
+    """Clean each of `paths` into its target with a process pool
+
+    Each piece (see split_ranges) is cleaned into a temporary file next to
+    the target, the pieces are joined and renamed over the target, so it's
+    never seen half written, and no part file outlives the call, whatever
+    fails. Prints a summary line per file and returns the exit status.
+    """
+    status = 0
+    totals = [0, 0, 0]
+    created = []  # Every part file; only the ones renamed over a target stay
+    futures = []
+    pool = concurrent.futures.ProcessPoolExecutor(jobs)
+    try:
+        pending = []
+        for path, target in zip(paths, targets):
+            parts = []
+            try:
+                os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+                for start, end in split_ranges(path, split_size):
+                    fd, part_path = tempfile.mkstemp(
+                        prefix=f".{os.path.basename(target)}.",
+                        suffix=".part",
+                        dir=os.path.dirname(target) or ".",
+                    )
+                    os.close(fd)
+                    created.append(part_path)
+                    future = pool.submit(
+                        clean_part, path, start, end, part_path, chunk_size, subn
+                    )
+                    futures.append(future)
+                    parts.append((part_path, future))
+            except OSError as e:
+                print(f"{path}: {e}", file=sys.stderr)
+                status = 1
+                for _, future in parts:
+                    future.cancel()
+                continue
+            pending.append((path, target, parts))
+
+        for path, target, parts in pending:
+            try:
+                stats = [future.result() for _, future in parts]
+                part_paths = [part_path for part_path, _ in parts]
+                with open(part_paths[0], "ab") as out:
+                    for part_path in part_paths[1:]:
+                        with open(part_path, "rb") as part:
+                            shutil.copyfileobj(part, out, CHUNK_SIZE)
+                        os.remove(part_path)
+                shutil.copymode(path, part_paths[0])
+                os.replace(part_paths[0], target)
+            except OSError as e:
+                print(f"{path}: {e}", file=sys.stderr)
+                status = 1
+                continue
+            bytes_in, bytes_out, removed = (sum(column) for column in zip(*stats))
+            for i, value in enumerate((bytes_in, bytes_out, removed)):
+                totals[i] += value
+            print(f"{target}: {bytes_in} -> {bytes_out} bytes, {removed} removed")
+    finally:
+        # Pieces not started yet are dropped and the running ones waited for,
+        # so no worker writes a part after it's removed
+        for future in futures:
+            future.cancel()
+        pool.shutdown()
+        for part_path in created:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    if len(paths) > 1:
+        print(f"total: {totals[0]} -> {totals[1]} bytes, {totals[2]} removed")
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "paths", nargs="*", help="files or globs to clean instead of stdin"
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument(
+        "--engine", choices=ENGINES, default="regex", help="how sequences are found"
+    )
+    parser.add_argument(
+        "--one-shot", action="store_true", help="read all input before cleaning"
+    )
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("-o", "--output-dir", help="write cleaned files here")
+    target.add_argument(
+        "-i", "--in-place", action="store_true", help="replace the files"
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--split-size",
+        type=int,
+        default=SPLIT_SIZE,
+        help="clean files larger than this in parallel pieces",
+    )
+    args = parser.parse_args(argv)
+    paths = expand_paths(args.paths)
+    sink = sys.stdout.buffer
+    subn = ENGINES[args.engine]
+
+    if args.output_dir or args.in_place:
+        if not paths:
+            parser.error("--output-dir and --in-place need files")
+        targets = output_paths(paths, args.output_dir)
+        return clean_files(
+            paths, targets, args.jobs, args.chunk_size, args.split_size, subn
+        )
+    if paths:
+        bytes_in = 0
+        status = 0
+        for path in paths:
+            try:
+                bytes_in += clean_file(
+                    path, sink, args.chunk_size, args.one_shot, subn=subn
+                )[0]
+            except OSError as e:
+                print(f"{path}: {e}", file=sys.stderr)
+                status = 1
+        if status or bytes_in:
+            return status
+    elif clean_stream(sys.stdin.buffer, sink, args.chunk_size, args.one_shot, subn)[0]:
+        return 0
+
+    print("No input provided")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())